@@ -0,0 +1,57 @@
+import time
+from boto3.dynamodb.conditions import Key
+from auth_utils import authenticate
+from http_utils import create_response, create_error_response
+from change_utils import get_latest_seq, get_changes_since
+from db_utils import receipt_repository, item_repository, split_repository, role_repository
+
+MAX_WAIT_SECONDS = 20 # Stay under API Gateway's 29s integration timeout
+POLL_INTERVAL_SECONDS = 1
+PAGE_SIZE = 100
+
+def get_snapshot(receipt_id):
+    # Consistent reads so the snapshot reflects every change up to the sequence read before it
+    partition = Key('receipt_id').eq(receipt_id)
+    receipt = receipt_repository.get({'id': receipt_id}, consistent=True)
+    return {
+        'receipt': receipt.to_item() if receipt else None,
+        'items': [item.to_item() for item in item_repository.query(partition, consistent=True)],
+        'splits': [split.to_item() for split in split_repository.query(partition, consistent=True)],
+        'roles': [role.to_item() for role in role_repository.query(partition, consistent=True)],
+    }
+
+def contiguous_changes(changes, since):
+    # None when the client fell behind the retained window and needs a snapshot;
+    # otherwise the changes up to the first hole, the next poll picks up the rest
+    if not changes or changes[0]['seq'] != since + 1:
+        return None
+    contiguous = [changes[0]]
+    for change in changes[1:]:
+        if change['seq'] != contiguous[-1]['seq'] + 1:
+            break
+        contiguous.append(change)
+    return contiguous
+
+@authenticate
+def get(event, context):
+    receipt_id = event['pathParameters']['receipt_id']
+    params = event.get('queryStringParameters') or {}
+    try:
+        since = int(params.get('since', 0))
+        wait = min(int(params.get('wait', 0)), MAX_WAIT_SECONDS)
+    except ValueError:
+        return create_error_response(400, 'since and wait must be integers')
+
+    latest = get_latest_seq(receipt_id)
+    deadline = time.time() + wait
+    while latest <= since and time.time() < deadline:
+        time.sleep(POLL_INTERVAL_SECONDS)
+        latest = get_latest_seq(receipt_id)
+    if latest <= since:
+        return create_response(200, {'data': {'changes': [], 'seq': latest, 'has_more': False}})
+
+    changes = contiguous_changes(get_changes_since(receipt_id, since, PAGE_SIZE), since)
+    if changes is None:
+        return create_response(200, {'data': {'snapshot': get_snapshot(receipt_id), 'seq': latest}})
+    seq = changes[-1]['seq']
+    return create_response(200, {'data': {'changes': changes, 'seq': seq, 'has_more': seq < latest}})
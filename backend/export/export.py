@@ -0,0 +1,196 @@
+import os
+import io
+import csv
+import json
+import uuid
+import boto3
+from botocore.exceptions import ClientError
+from boto3.dynamodb.conditions import Key
+from auth_utils import authenticate
+from http_utils import create_response, create_error_response, encode_decimal
+from db_utils import role_repository, receipt_repository, item_repository, split_repository
+
+s3 = boto3.client('s3')
+lambda_client = boto3.client('lambda')
+EXPORT_BUCKET_NAME = os.environ.get('EXPORT_BUCKET_NAME')
+EXPORT_FUNCTION_NAME = os.environ.get('EXPORT_FUNCTION_NAME')
+
+FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+ROLE_PAGE_SIZE = 25
+PART_SIZE = 5 * 1024 * 1024 # S3 minimum for every part but the last
+URL_EXPIRY_SECONDS = 3600
+COLUMNS = [
+    'record_type', 'receipt_id', 'created_at', 'role', 'grand_total', 'shared_cost', 'amount_owed',
+    'item_id', 'item_name', 'item_quantity', 'item_price', 'split_id', 'split_quantity', 'split',
+]
+
+def job_prefix(user_id, job_id):
+    return f'exports/{user_id}/{job_id}.'
+
+def export_key(user_id, job_id, fmt):
+    return job_prefix(user_id, job_id) + fmt
+
+def error_key(user_id, job_id):
+    return job_prefix(user_id, job_id) + 'error'
+
+def iter_receipts(user_id):
+    # One index page and one batch get at a time, so memory doesn't grow with history
+    start_key = None
+    while True:
+        roles, start_key = role_repository.query_page(
+            Key('user_id').eq(user_id),
+            index='rolesByUser',
+            projection='history',
+            limit=ROLE_PAGE_SIZE,
+            start_key=start_key,
+            ascending=False
+        )
+        receipts = {
+            receipt.id: receipt
+            for receipt in receipt_repository.batch_get([{'id': role.receipt_id} for role in roles])
+        }
+        for role in roles:
+            if role.receipt_id in receipts:
+                yield role, receipts[role.receipt_id]
+        if not start_key:
+            return
+
+def iter_rows(user_id):
+    for role, receipt in iter_receipts(user_id):
+        base = {'receipt_id': receipt.id, 'created_at': role.created_at, 'role': role.role}
+        yield {
+            **base,
+            'record_type': 'receipt',
+            'grand_total': receipt.grand_total,
+            'shared_cost': receipt.shared_cost,
+            'amount_owed': role.total,
+        }
+        partition = Key('receipt_id').eq(receipt.id)
+        items = item_repository.query(partition)
+        item_names = {item.id: item.name for item in items}
+        for item in items:
+            yield {
+                **base,
+                'record_type': 'item',
+                'item_id': item.id,
+                'item_name': item.name,
+                'item_quantity': item.quantity,
+                'item_price': item.price,
+            }
+        splits = split_repository.query(partition & Key('user_id').eq(user_id), index='splitsByUser')
+        for split in splits:
+            yield {
+                **base,
+                'record_type': 'split',
+                'item_id': split.item_id,
+                'item_name': item_names.get(split.item_id),
+                'split_id': split.id,
+                'split_quantity': split.quantity,
+                'split': split.split,
+            }
+
+def iter_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=COLUMNS)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.getvalue():
+        yield buffer.getvalue().encode()
+
+def iter_jsonl(rows):
+    for row in rows:
+        yield (json.dumps(row, default=encode_decimal) + '\n').encode()
+
+def iter_parts(chunks):
+    part = bytearray()
+    for chunk in chunks:
+        part.extend(chunk)
+        if len(part) >= PART_SIZE:
+            yield bytes(part)
+            part = bytearray()
+    if part:
+        yield bytes(part)
+
+def upload_stream(key, content_type, chunks):
+    upload_id = s3.create_multipart_upload(
+        Bucket=EXPORT_BUCKET_NAME, Key=key, ContentType=content_type
+    )['UploadId']
+    parts = []
+    try:
+        for part_number, body in enumerate(iter_parts(chunks), start=1):
+            response = s3.upload_part(
+                Bucket=EXPORT_BUCKET_NAME, Key=key, UploadId=upload_id,
+                PartNumber=part_number, Body=body
+            )
+            parts.append({'PartNumber': part_number, 'ETag': response['ETag']})
+        if parts:
+            s3.complete_multipart_upload(
+                Bucket=EXPORT_BUCKET_NAME, Key=key, UploadId=upload_id,
+                MultipartUpload={'Parts': parts}
+            )
+    except Exception:
+        s3.abort_multipart_upload(Bucket=EXPORT_BUCKET_NAME, Key=key, UploadId=upload_id)
+        raise
+    if not parts:
+        # A user with no receipts still gets an (empty) file
+        s3.abort_multipart_upload(Bucket=EXPORT_BUCKET_NAME, Key=key, UploadId=upload_id)
+        s3.put_object(Bucket=EXPORT_BUCKET_NAME, Key=key, Body=b'', ContentType=content_type)
+
+def run(event, context):
+    # Invoked asynchronously by start, outside API Gateway's timeout. Failures are
+    # reported through the error marker rather than raised, since a retried
+    # invocation would repeat the whole export
+    user_id = event['user_id']
+    job_id = event['job_id']
+    fmt = event['format']
+    serialize = iter_csv if fmt == 'csv' else iter_jsonl
+    try:
+        upload_stream(export_key(user_id, job_id, fmt), FORMATS[fmt], serialize(iter_rows(user_id)))
+    except Exception as e:
+        print(f'Export {job_id} for {user_id} failed: {e}')
+        s3.put_object(Bucket=EXPORT_BUCKET_NAME, Key=error_key(user_id, job_id), Body=str(e).encode())
+
+@authenticate
+def start(event, context):
+    user = event['user']
+    params = event.get('queryStringParameters') or {}
+    fmt = params.get('format', 'csv')
+    if fmt not in FORMATS:
+        return create_error_response(400, f'format must be one of {list(FORMATS)}')
+    job_id = uuid.uuid4().hex
+    try:
+        lambda_client.invoke(
+            FunctionName=EXPORT_FUNCTION_NAME,
+            InvocationType='Event',
+            Payload=json.dumps({'user_id': user['id'], 'job_id': job_id, 'format': fmt})
+        )
+    except ClientError as e:
+        return create_error_response(500, str(e))
+    return create_response(202, {'message': 'Export started', 'job_id': job_id, 'format': fmt})
+
+@authenticate
+def status(event, context):
+    user = event['user']
+    job_id = event['pathParameters']['job_id']
+    # The finished file's extension records the format, so the client doesn't have to
+    try:
+        response = s3.list_objects_v2(Bucket=EXPORT_BUCKET_NAME, Prefix=job_prefix(user['id'], job_id))
+        keys = [obj['Key'] for obj in response.get('Contents', [])]
+        if error_key(user['id'], job_id) in keys:
+            error = s3.get_object(Bucket=EXPORT_BUCKET_NAME, Key=error_key(user['id'], job_id))
+            return create_error_response(500, error['Body'].read().decode())
+    except ClientError as e:
+        return create_error_response(500, str(e))
+    key = next((key for key in keys if key.rsplit('.', 1)[-1] in FORMATS), None)
+    if key is None:
+        return create_response(202, {'message': 'Export in progress', 'job_id': job_id})
+    url = s3.generate_presigned_url(
+        'get_object',
+        Params={'Bucket': EXPORT_BUCKET_NAME, 'Key': key},
+        ExpiresIn=URL_EXPIRY_SECONDS
+    )
+    return create_response(200, {'message': 'Export ready', 'job_id': job_id, 'download_url': url})
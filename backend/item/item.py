@@ -1,53 +1,60 @@
 import json
 import uuid
-import boto3
 from botocore.exceptions import ClientError
 from boto3.dynamodb.conditions import Key
 from http_utils import create_response, create_error_response
 from price_utils import formatPrice
 from auth_utils import authenticate
+from change_utils import record_change, get_latest_seq
+from db_utils import Item, item_repository
+from cache_utils import TTLCache
 
-table = boto3.resource('dynamodb').Table('items')
+items_cache = TTLCache('items')
 
 @authenticate
 def get(event, context):
     receipt_id = event['pathParameters']['receipt_id']
     try:
-        response = table.query(
-            KeyConditionExpression=Key('receipt_id').eq(receipt_id)
+        # Consistent like the version read, otherwise items from before a write
+        # could be cached under its seq and pass revalidation until the TTL
+        items = items_cache.get_or_load(
+            receipt_id,
+            lambda: item_repository.query(Key('receipt_id').eq(receipt_id), consistent=True),
+            version=lambda: get_latest_seq(receipt_id)
         )
-        items = response['Items']
     except ClientError as e:
         return create_error_response(500, str(e))
-    return create_response(200, {'data': items})
+    items_cache.log_stats()
+    return create_response(200, {'data': [item.to_item() for item in items]})
 
 @authenticate
 def post(event, context):
     receipt_id = event['pathParameters']['receipt_id']
     data = json.loads(event['body'])
     try:
-        item = {
-            'id': uuid.uuid4().hex,
-            'name': data.get('name', ''),
-            'quantity': str(int(data.get('quantity', 0))),
-            'price': formatPrice(float(data.get('price', 0))),
-            'receipt_id': str(receipt_id)
-        }
-        table.put_item(Item=item)
+        item = Item(
+            id=uuid.uuid4().hex,
+            name=data.get('name', ''),
+            quantity=str(int(data.get('quantity', 0))),
+            price=formatPrice(float(data.get('price', 0))),
+            receipt_id=str(receipt_id)
+        )
+        item_repository.put(item)
+        record_change(receipt_id, 'item', 'put', item.id, item.to_item())
     except ClientError as e:
         return create_error_response(500, str(e))
-    return create_response(201, {'message': 'Item created', 'data': item})
+    return create_response(201, {'message': 'Item created', 'data': item.to_item()})
 
 @authenticate
 def get_by_id(event, context):
     receipt_id = event['pathParameters']['receipt_id']
     id = event['pathParameters']['item_id']
     try:
-        response = table.get_item(Key={'receipt_id': receipt_id, 'id': id})
+        item = item_repository.get({'receipt_id': receipt_id, 'id': id})
     except ClientError as e:
         return create_error_response(500, str(e))
-    if 'Item' in response:
-        return create_response(200, {'data': response['Item']})
+    if item:
+        return create_response(200, {'data': item.to_item()})
     return create_error_response(404, 'Item not found')
 
 @authenticate
@@ -55,36 +62,29 @@ def update_by_id(event, context):
     receipt_id = event['pathParameters']['receipt_id']
     id = event['pathParameters']['item_id']
     data = json.loads(event['body'])
-    update_expression = "SET "
-    expression_attribute_values = {}
+    fields = {}
     if 'name' in data:
-        update_expression += "#name = :name, "
-        expression_attribute_values[':name'] = data['name']
+        fields['name'] = data['name']
     if 'price' in data:
-        data['price'] = formatPrice(float(data['price']))
-        update_expression += "#price = :price, "
-        expression_attribute_values[':price'] = data['price']
+        fields['price'] = data['price'] = formatPrice(float(data['price']))
     if 'quantity' in data:
-        data['quantity'] = str(int(data['quantity']))
-        update_expression += "#quantity = :quantity, "
-        expression_attribute_values[':quantity'] = data['quantity']
-    update_expression = update_expression.rstrip(", ")
-    expression_attribute_names = {
-        "#name": "name",
-        "#price": "price",
-        "#quantity": "quantity"
-    }
-    table.update_item(
-        Key={'receipt_id': receipt_id, 'id': id},
-        UpdateExpression=update_expression,
-        ExpressionAttributeNames=expression_attribute_names,
-        ExpressionAttributeValues=expression_attribute_values
-    )
+        fields['quantity'] = data['quantity'] = str(int(data['quantity']))
+    if not fields:
+        return create_error_response(400, 'No updatable fields provided')
+    try:
+        item_repository.update({'receipt_id': receipt_id, 'id': id}, fields)
+        record_change(receipt_id, 'item', 'update', id, fields)
+    except ClientError as e:
+        return create_error_response(500, str(e))
     return create_response(200, {'message': 'Item updated', 'data': data})
 
 @authenticate
 def delete_by_id(event, context):
     receipt_id = event['pathParameters']['receipt_id']
     id = event['pathParameters']['item_id']
-    table.delete_item(Key={'receipt_id': receipt_id, 'id': id})
+    try:
+        item_repository.delete({'receipt_id': receipt_id, 'id': id})
+        record_change(receipt_id, 'item', 'delete', id)
+    except ClientError as e:
+        return create_error_response(500, str(e))
     return create_response(200, {"message": "Item deleted"})
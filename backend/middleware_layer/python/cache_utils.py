@@ -0,0 +1,98 @@
+import os
+import json
+import time
+from collections import OrderedDict
+
+DEFAULT_TTL_SECONDS = int(os.environ.get('CACHE_TTL_SECONDS', '30'))
+DEFAULT_FRESH_SECONDS = int(os.environ.get('CACHE_FRESH_SECONDS', '2'))
+
+class CacheEntry:
+    __slots__ = ('value', 'version', 'checked_at', 'expires_at')
+
+    def __init__(self, value, version, now, ttl):
+        self.value = value
+        self.version = version
+        self.checked_at = now
+        self.expires_at = now + ttl
+
+class TTLCache:
+    # In-process LRU cache that lives as long as the warm Lambda container.
+    # Entries younger than fresh_seconds are served as-is; older ones are
+    # revalidated against a cheap version read until they expire after ttl.
+    def __init__(self, name, maxsize=256, ttl=DEFAULT_TTL_SECONDS, fresh_seconds=DEFAULT_FRESH_SECONDS):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.fresh_seconds = fresh_seconds
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_load(self, key, loader, version=None):
+        now = time.monotonic()
+        entry = self.entries.get(key)
+        current_version = None
+        if entry and now < entry.expires_at:
+            if version is None or now - entry.checked_at < self.fresh_seconds:
+                return self._hit(key, entry)
+            current_version = version()
+            if current_version == entry.version:
+                entry.checked_at = now
+                return self._hit(key, entry)
+        self.misses += 1
+        # Read the version before the data so a concurrent write forces a reload next time
+        if version is not None and current_version is None:
+            current_version = version()
+        value = loader()
+        if value is not None:
+            self.set(key, value, current_version)
+        return value
+
+    def get_many_or_load(self, keys, loader):
+        # loader takes the missing keys and returns a dict of key -> value
+        now = time.monotonic()
+        found = {}
+        missing = []
+        for key in keys:
+            entry = self.entries.get(key)
+            if entry and now < entry.expires_at:
+                found[key] = self._hit(key, entry)
+            else:
+                self.misses += 1
+                missing.append(key)
+        if missing:
+            for key, value in loader(missing).items():
+                self.set(key, value)
+                found[key] = value
+        return found
+
+    def _hit(self, key, entry):
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry.value
+
+    def set(self, key, value, version=None):
+        self.entries[key] = CacheEntry(value, version, time.monotonic(), self.ttl)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key):
+        self.entries.pop(key, None)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'cache': self.name,
+            'size': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+    def log_stats(self):
+        # Structured so a CloudWatch metric filter can chart hit rates
+        print(json.dumps(self.stats()))
@@ -0,0 +1,81 @@
+import time
+import boto3
+from botocore.exceptions import ClientError
+from boto3.dynamodb.conditions import Key, Attr
+
+CHANGE_TTL_SECONDS = 60 * 60
+HEAD_SEQ = 0 # Per-receipt counter row, change records start at seq 1
+SEQ_ATTEMPTS = 3
+SEQ_BACKOFF_SECONDS = 0.05
+
+changes_table = boto3.resource('dynamodb').Table('changes')
+
+def next_seq(receipt_id):
+    # Retrying is safe: if a bump landed but its response was lost, the
+    # retry just skips a seq, which readers handle as a gap
+    for attempt in range(SEQ_ATTEMPTS):
+        try:
+            response = changes_table.update_item(
+                Key={'receipt_id': receipt_id, 'seq': HEAD_SEQ},
+                UpdateExpression="ADD #latest :one",
+                ExpressionAttributeNames={"#latest": "latest"},
+                ExpressionAttributeValues={":one": 1},
+                ReturnValues="UPDATED_NEW"
+            )
+            return int(response['Attributes']['latest'])
+        except ClientError:
+            if attempt == SEQ_ATTEMPTS - 1:
+                raise
+            time.sleep(SEQ_BACKOFF_SECONDS * 2 ** attempt)
+
+def record_change(receipt_id, entity, op, id, data=None):
+    # The seq bump is what tells readers (and version-checked caches) that a
+    # write happened, so if it fails the ClientError propagates and the caller
+    # returns a 500. Once it succeeds, a failed record put only leaves a gap in
+    # the sequence, which makes readers fall back to a snapshot
+    seq = next_seq(receipt_id)
+    try:
+        now = int(time.time())
+        changes_table.put_item(
+            Item={
+                'receipt_id': receipt_id,
+                'seq': seq,
+                'entity': entity,
+                'op': op,
+                'id': id,
+                'data': data or {},
+                'created_at': now,
+                'ttl': now + CHANGE_TTL_SECONDS,
+            }
+        )
+    except ClientError as e:
+        print(f'Failed to record {entity} {op} change for {receipt_id}: {e}')
+    return seq
+
+def get_latest_seq(receipt_id):
+    response = changes_table.get_item(
+        Key={'receipt_id': receipt_id, 'seq': HEAD_SEQ},
+        ProjectionExpression="#latest",
+        ExpressionAttributeNames={"#latest": "latest"},
+        ConsistentRead=True
+    )
+    return int(response.get('Item', {}).get('latest', 0))
+
+def get_changes_since(receipt_id, since, limit=100):
+    # TTL deletion lags expiry, so filter out expired records ourselves
+    response = changes_table.query(
+        KeyConditionExpression=Key('receipt_id').eq(receipt_id) & Key('seq').gt(since),
+        FilterExpression=Attr('ttl').gt(int(time.time())),
+        Limit=limit,
+        ConsistentRead=True
+    )
+    return [
+        {
+            'seq': int(change['seq']),
+            'entity': change['entity'],
+            'op': change['op'],
+            'id': change['id'],
+            'data': change['data'],
+        }
+        for change in response['Items']
+    ]
@@ -0,0 +1,181 @@
+import time
+import random
+import boto3
+from botocore.exceptions import ClientError
+from boto3.dynamodb.conditions import Attr
+
+dynamodb = boto3.resource('dynamodb')
+
+BATCH_GET_LIMIT = 100
+BATCH_GET_MAX_ATTEMPTS = 5
+BATCH_GET_BACKOFF_SECONDS = 0.05
+
+class Model:
+    # Attributes without a slot are kept in extra so a read-modify-write never drops them
+    __slots__ = ('extra',)
+
+    def __init__(self, **attrs):
+        for field in self.__slots__:
+            setattr(self, field, attrs.pop(field, None))
+        self.extra = attrs
+
+    @classmethod
+    def from_item(cls, item):
+        return cls(**item)
+
+    def to_item(self):
+        item = dict(self.extra)
+        for field in self.__slots__:
+            value = getattr(self, field)
+            if value is not None:
+                item[field] = value
+        return item
+
+class Receipt(Model):
+    __slots__ = ('id', 'image_url', 'shared_cost', 'grand_total', 'participant_count')
+
+class Item(Model):
+    __slots__ = ('receipt_id', 'id', 'name', 'quantity', 'price')
+
+class Split(Model):
+    __slots__ = ('receipt_id', 'id', 'item_id', 'user_id', 'quantity', 'split')
+
+class Role(Model):
+    __slots__ = ('receipt_id', 'user_id', 'id', 'role', 'total', 'created_at')
+
+class User(Model):
+    __slots__ = ('id', 'name', 'phone', 'venmo_handle', 'data')
+
+def build_projection(fields):
+    names = {f'#p{i}': field for i, field in enumerate(fields)}
+    return {
+        'ProjectionExpression': ', '.join(names),
+        'ExpressionAttributeNames': names
+    }
+
+def build_update(fields):
+    # Returns None when there's nothing to set, an empty SET is rejected by DynamoDB
+    if not fields:
+        return None
+    names = {}
+    values = {}
+    assignments = []
+    for i, (field, value) in enumerate(fields.items()):
+        names[f'#f{i}'] = field
+        values[f':v{i}'] = value
+        assignments.append(f'#f{i} = :v{i}')
+    return {
+        'UpdateExpression': 'SET ' + ', '.join(assignments),
+        'ExpressionAttributeNames': names,
+        'ExpressionAttributeValues': values
+    }
+
+class Repository:
+    def __init__(self, table_name, model, projections=None):
+        self.table = dynamodb.Table(table_name)
+        self.model = model
+        # The default reads whole items; named projections are for hot, narrow reads
+        self.projections = {'default': None, **(projections or {})}
+
+    def _read_options(self, projection, consistent):
+        fields = self.projections[projection] if isinstance(projection, str) else projection
+        options = build_projection(fields) if fields else {}
+        if consistent:
+            options['ConsistentRead'] = True
+        return options
+
+    def get(self, key, projection='default', consistent=False):
+        response = self.table.get_item(Key=key, **self._read_options(projection, consistent))
+        item = response.get('Item')
+        return self.model.from_item(item) if item else None
+
+    def query_page(self, key_condition, index=None, projection='default', consistent=False,
+                   limit=None, start_key=None, ascending=True):
+        kwargs = {'KeyConditionExpression': key_condition, **self._read_options(projection, consistent)}
+        if index:
+            kwargs['IndexName'] = index
+        if limit:
+            kwargs['Limit'] = limit
+        if start_key:
+            kwargs['ExclusiveStartKey'] = start_key
+        if not ascending:
+            kwargs['ScanIndexForward'] = False
+        response = self.table.query(**kwargs)
+        models = [self.model.from_item(item) for item in response['Items']]
+        return models, response.get('LastEvaluatedKey')
+
+    def query(self, key_condition, index=None, projection='default', consistent=False):
+        models, start_key = self.query_page(key_condition, index, projection, consistent)
+        while start_key:
+            page, start_key = self.query_page(key_condition, index, projection, consistent, start_key=start_key)
+            models.extend(page)
+        return models
+
+    def batch_get(self, keys, projection='default'):
+        models = []
+        name = self.table.name
+        for i in range(0, len(keys), BATCH_GET_LIMIT):
+            request = {name: {'Keys': keys[i:i + BATCH_GET_LIMIT], **self._read_options(projection, False)}}
+            attempt = 0
+            while request:
+                if attempt:
+                    # Unprocessed keys mean the table is throttling, so back off
+                    # with jitter instead of retrying straight away
+                    time.sleep(random.uniform(0, BATCH_GET_BACKOFF_SECONDS * 2 ** attempt))
+                response = dynamodb.batch_get_item(RequestItems=request)
+                models.extend(self.model.from_item(item) for item in response.get('Responses', {}).get(name, []))
+                request = response.get('UnprocessedKeys')
+                attempt += 1
+                if request and attempt == BATCH_GET_MAX_ATTEMPTS:
+                    # Surfaces like any other throttled call, so handlers return a 500
+                    raise ClientError({'Error': {
+                        'Code': 'ProvisionedThroughputExceededException',
+                        'Message': f'{len(request[name]["Keys"])} keys still unprocessed after {attempt} attempts'
+                    }}, 'BatchGetItem')
+        return models
+
+    def put(self, model, condition=None):
+        # A failed condition raises ClientError with ConditionalCheckFailedException
+        kwargs = {'ConditionExpression': condition} if condition is not None else {}
+        self.table.put_item(Item=model.to_item(), **kwargs)
+
+    def update(self, key, fields, condition=None, return_new=False):
+        update = build_update(fields)
+        if update is None:
+            return None if return_new else False
+        if condition is not None:
+            update['ConditionExpression'] = condition
+        if not return_new:
+            self.table.update_item(Key=key, **update)
+            return True
+        response = self.table.update_item(Key=key, ReturnValues='ALL_NEW', **update)
+        return self.model.from_item(response['Attributes'])
+
+    def increment(self, key, field, delta):
+        # Conditional so a counter bump never creates a stub row for a missing key
+        self.table.update_item(
+            Key=key,
+            UpdateExpression="ADD #field :delta",
+            ConditionExpression=Attr(next(iter(key))).exists(),
+            ExpressionAttributeNames={"#field": field},
+            ExpressionAttributeValues={":delta": delta}
+        )
+
+    def delete(self, key, return_old=False):
+        if not return_old:
+            self.table.delete_item(Key=key)
+            return None
+        response = self.table.delete_item(Key=key, ReturnValues='ALL_OLD')
+        old = response.get('Attributes')
+        return self.model.from_item(old) if old else None
+
+receipt_repository = Repository('receipts', Receipt, {
+    'summary': ('id', 'grand_total', 'participant_count'),
+})
+item_repository = Repository('items', Item)
+split_repository = Repository('splits', Split)
+role_repository = Repository('roles', Role, {
+    'participant': ('user_id', 'role'),
+    'history': ('receipt_id', 'user_id', 'role', 'total', 'created_at'),
+})
+user_repository = Repository('users', User)
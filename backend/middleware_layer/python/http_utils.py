@@ -1,4 +1,11 @@
 import json
+from decimal import Decimal
+
+def encode_decimal(value):
+    # DynamoDB returns every number as a Decimal
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
 
 def create_response(status_code, body):
     return {
@@ -8,7 +15,7 @@ def create_response(status_code, body):
             'Access-Control-Allow-Origin': '*',
             'Access-Control-Allow-Methods': 'OPTIONS,POST,GET,PUT,DELETE'
         },
-        'body': json.dumps(body) 
+        'body': json.dumps(body, default=encode_decimal)
     }
 
 def create_error_response(status_code, error):
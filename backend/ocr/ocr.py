@@ -3,14 +3,54 @@ import json
 import re
 import boto3
 import uuid
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from botocore.config import Config
 from auth_utils import authenticate
 from http_utils import create_response, create_error_response
 from price_utils import formatPrice
+from change_utils import record_change
+from db_utils import build_update
+from preprocess import preprocess_image, is_available as preprocess_available
 
-textract = boto3.client('textract')
+BUCKET_NAME = os.environ.get('BUCKET_NAME')
+PREPROCESS = os.environ.get('OCR_PREPROCESS', 'false') == 'true'
+NORMALIZED_PREFIX = 'normalized/'
+TEXTRACT_MAX_BYTES = 10 * 1024 * 1024 # Synchronous DetectDocumentText limit for JPEG/PNG
+# Keep batch fan-out under Textract's DetectDocumentText TPS quota; adaptive
+# retries back off client-side when Textract or DynamoDB start throttling
+MAX_WORKERS = int(os.environ.get('OCR_MAX_WORKERS', '4'))
+MAX_BATCH_SIZE = 20
+RETRY_CONFIG = Config(retries={'mode': 'adaptive', 'max_attempts': 4}, connect_timeout=5, read_timeout=15)
+# The batch endpoint sits behind API Gateway's 29s limit, so it stops starting
+# receipts that can't finish in time and reports them back as unprocessed
+API_TIMEOUT_SECONDS = 29
+RESPONSE_MARGIN_SECONDS = 2
+MIN_RECEIPT_SECONDS = 8
+WRITE_MARGIN_SECONDS = 2 # Writes must start this long before the response goes out
+_thread_local = threading.local()
+
+class DeadlineExceeded(Exception):
+    pass
+
+class WriteGate:
+    # Decides, once, whether a batch worker gets to write or the request gives
+    # up on it, so a receipt reported as unprocessed is never written later
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.state = None
+
+    def claim(self, state):
+        with self.lock:
+            if self.state is None:
+                self.state = state
+            return self.state == state
+
+s3 = boto3.client('s3')
+textract = boto3.client('textract', config=RETRY_CONFIG)
 receipts_table = boto3.resource('dynamodb').Table('receipts')
 items_table = boto3.resource('dynamodb').Table('items')
-BUCKET_NAME = os.environ.get('BUCKET_NAME')
 
 def mean(array):
     return sum(array) / len(array)
@@ -189,18 +229,7 @@ class Receipt:
                         filtered_prices[i]['text'].replace('$', ''))
         return output_items, output_quantities, output_prices, grand_total
 
-@authenticate
-def receipt_ocr(event, context):
-    packet = json.loads(event.get('body'))
-    receipt_id = packet.get('key')
-    response = textract.detect_document_text(
-        Document={
-            'S3Object': {
-                'Bucket': BUCKET_NAME,
-                'Name': f'{receipt_id}'
-            }
-        }
-    )
+def extract_words(response):
     words = []
     for item in response['Blocks']:
         if item['BlockType'] == 'WORD':
@@ -216,41 +245,237 @@ def receipt_ocr(event, context):
                  'y': bounding_box['Top'] + bounding_box['Height']}]
             words.append(
                 {'text': item['Text'], 'bounding_box': bounding_box_fmt})
+    return words
+
+def normalize_upload(key, timings):
+    # Write a smaller grayscale derivative next to the original and OCR that instead
+    start = time.perf_counter()
+    data = s3.get_object(Bucket=BUCKET_NAME, Key=key)['Body'].read()
+    timings['download'] = round((time.perf_counter() - start) * 1000, 2)
+    output, stats = preprocess_image(data)
+    timings.update(stats['timings_ms'])
+    normalized_key = f'{NORMALIZED_PREFIX}{key}.jpg'
+    start = time.perf_counter()
+    s3.put_object(Bucket=BUCKET_NAME, Key=normalized_key, Body=output, ContentType='image/jpeg')
+    timings['upload'] = round((time.perf_counter() - start) * 1000, 2)
+    print(f'Preprocessed {key}: {stats["input_bytes"]} -> {stats["output_bytes"]} bytes')
+    return normalized_key
+
+def get_batch_tables():
+    # boto3 resources aren't thread-safe, so each batch worker gets its own
+    if not hasattr(_thread_local, 'tables'):
+        dynamodb = boto3.session.Session().resource('dynamodb', config=RETRY_CONFIG)
+        _thread_local.tables = (dynamodb.Table('receipts'), dynamodb.Table('items'))
+    return _thread_local.tables
+
+def item_id(receipt_id, index):
+    # Deterministic so re-running OCR overwrites its own items instead of duplicating them
+    return uuid.uuid5(uuid.NAMESPACE_URL, f'receipt/{receipt_id}/item/{index}').hex
+
+def is_oversized(key):
+    return s3.head_object(Bucket=BUCKET_NAME, Key=key)['ContentLength'] > TEXTRACT_MAX_BYTES
+
+def ocr_page(key, preprocess, timings):
+    # Pages over Textract's limit (multipart uploads) are always preprocessed,
+    # and can't fall back to the original since Textract would reject it
+    ocr_key = key
+    if preprocess and preprocess_available():
+        try:
+            ocr_key = normalize_upload(key, timings)
+        except Exception as e:
+            if is_oversized(key):
+                raise
+            print(f'Preprocessing failed, using original image: {e}')
+    elif is_oversized(key):
+        if not preprocess_available():
+            raise RuntimeError(f'{key} is over {TEXTRACT_MAX_BYTES} bytes and Pillow is not available to shrink it')
+        ocr_key = normalize_upload(key, timings)
+    start = time.perf_counter()
+    response = textract.detect_document_text(
+        Document={
+            'S3Object': {
+                'Bucket': BUCKET_NAME,
+                'Name': f'{ocr_key}'
+            }
+        }
+    )
+    timings['textract'] = round((time.perf_counter() - start) * 1000, 2)
+    return Receipt().parse(extract_words(response))
+
+def page_keys_for(receipt_id, keys):
+    # Pages of a multi-page upload are issued as pages/<receipt_id>/<n>
+    prefix = f'pages/{receipt_id}/'
+    if not isinstance(keys, list) or not keys or not all(
+        isinstance(key, str) and key.startswith(prefix) and key[len(prefix):].isdigit() for key in keys
+    ):
+        raise ValueError(f'keys must be page keys under {prefix}')
+    return sorted(set(keys), key=lambda key: int(key[len(prefix):]))
+
+def process_receipt(receipt_id, preprocess, receipts_table=receipts_table, items_table=items_table,
+                    deadline=None, page_keys=None, gate=None):
+    page_keys = page_keys or [receipt_id]
+    page_timings = []
+    items, quantities, prices = [], [], []
+    grand_total = 0.0
+    for key in page_keys:
+        timings = {}
+        page_items, page_quantities, page_prices, page_total = ocr_page(key, preprocess, timings)
+        items.extend(page_items)
+        quantities.extend(page_quantities)
+        prices.extend(page_prices)
+        # The total is printed once, normally on the last page that has one
+        grand_total = page_total or grand_total
+        page_timings.append(timings)
+    timings = page_timings[0] if len(page_timings) == 1 else {'pages': page_timings}
 
-    receipt_model = Receipt()
-    items, quantities, prices, grand_total = receipt_model.parse(words)
     shared_cost = grand_total - sum([prices[i]*quantities[i] for i in range(len(prices))])
     if shared_cost < 0:
         print('Shared cost is negative')
         grand_total = sum(prices)
         shared_cost = 0
 
-    item_ids = []
-    for i in range(len(items)):
-        item_id = uuid.uuid4().hex
-        item_ids.append(item_id)
-        try:
-            items_table.put_item(
+    if deadline is not None and time.monotonic() > deadline:
+        # Don't write a receipt the caller is about to be told wasn't processed
+        raise DeadlineExceeded('Request deadline reached before writing')
+    if gate is not None and not gate.claim('writing'):
+        raise DeadlineExceeded('Request gave up on this receipt before writing')
+    start = time.perf_counter()
+    with items_table.batch_writer() as batch:
+        for i in range(len(items)):
+            batch.put_item(
                 Item={
-                    'id': str(item_id),
+                    'id': item_id(receipt_id, i),
                     'receipt_id': str(receipt_id),
                     'name': items[i],
                     'quantity': str(quantities[i]),
                     'price': formatPrice(prices[i])
                 }
             )
-        except Exception as e:
-            return create_error_response(500, str(e))
+    # Update rather than put, so counters like participant_count survive a re-run
+    receipts_table.update_item(
+        Key={'id': str(receipt_id)},
+        **build_update({
+            'image_url': f'https://{BUCKET_NAME}.s3.amazonaws.com/{page_keys[0]}',
+            'shared_cost': formatPrice(shared_cost),
+            'grand_total': formatPrice(grand_total),
+        })
+    )
+    timings['write'] = round((time.perf_counter() - start) * 1000, 2)
+    print(f'OCR timings (ms) for {receipt_id}: {timings}')
+    return {
+        'key': receipt_id,
+        'item_count': len(items),
+        'grand_total': formatPrice(grand_total),
+        'timings': timings,
+    }
+
+def unprocessed_result(receipt_id):
+    return {'status': 'unprocessed', 'key': receipt_id, 'error': 'Not processed before the request deadline, retry'}
+
+def process_batch_receipt(receipt_id, preprocess, deadline, gate):
+    if deadline - time.monotonic() < MIN_RECEIPT_SECONDS:
+        return unprocessed_result(receipt_id)
+    receipts, items = get_batch_tables()
     try:
-        receipts_table.put_item(
-            Item={
-                'id': str(receipt_id),
-                'image_url': f'https://{BUCKET_NAME}.s3.amazonaws.com/{receipt_id}',
-                'shared_cost': formatPrice(shared_cost),
-                'grand_total': formatPrice(grand_total),
-            }
-        )
+        return {'status': 'ok', **process_receipt(
+            receipt_id, preprocess, receipts, items, deadline - WRITE_MARGIN_SECONDS, gate=gate
+        )}
+    except DeadlineExceeded:
+        return unprocessed_result(receipt_id)
+    except Exception as e:
+        return {'status': 'error', 'key': receipt_id, 'error': str(e)}
+
+def parse_preprocess(packet):
+    # Only a real boolean; "false" is truthy and would turn preprocessing on
+    preprocess = packet.get('preprocess', PREPROCESS)
+    if not isinstance(preprocess, bool):
+        raise ValueError('preprocess must be a boolean')
+    return preprocess
+
+def get_deadline(context):
+    budget = API_TIMEOUT_SECONDS
+    if context is not None:
+        budget = min(budget, context.get_remaining_time_in_millis() / 1000)
+    return time.monotonic() + budget - RESPONSE_MARGIN_SECONDS
+
+@authenticate
+def receipt_ocr(event, context):
+    packet = json.loads(event.get('body'))
+    if 'receipt_id' in packet:
+        # Multi-page receipt: {"receipt_id": ..., "keys": ["pages/<receipt_id>/0", ...]}
+        receipt_id = packet['receipt_id']
+        if not isinstance(receipt_id, str) or not receipt_id or '/' in receipt_id:
+            return create_error_response(400, 'Invalid receipt_id')
+        try:
+            page_keys = page_keys_for(receipt_id, packet.get('keys'))
+        except ValueError as e:
+            return create_error_response(400, str(e))
+    else:
+        receipt_id = packet.get('key')
+        page_keys = None
+        if not isinstance(receipt_id, str) or not receipt_id or '/' in receipt_id:
+            return create_error_response(400, 'Invalid key')
+    try:
+        preprocess = parse_preprocess(packet)
+    except ValueError as e:
+        return create_error_response(400, str(e))
+    try:
+        result = process_receipt(receipt_id, preprocess, page_keys=page_keys)
+        record_change(receipt_id, 'receipt', 'ocr', receipt_id, {'item_count': result['item_count']})
     except Exception as e:
         return create_error_response(500, str(e))
+    return create_response(200, {'message': 'Receipt processed successfully', 'timings': result['timings']})
 
-    return create_response(200, {'message': 'Receipt processed successfully'})
\ No newline at end of file
+@authenticate
+def batch_receipt_ocr(event, context):
+    packet = json.loads(event.get('body'))
+    keys = packet.get('keys', [])
+    try:
+        preprocess = parse_preprocess(packet)
+    except ValueError as e:
+        return create_error_response(400, str(e))
+    if not isinstance(keys, list) or not keys:
+        return create_error_response(400, 'keys must be a non-empty list')
+    if len(keys) > MAX_BATCH_SIZE:
+        return create_error_response(400, f'At most {MAX_BATCH_SIZE} receipts per batch')
+    if not all(isinstance(key, str) and key and '/' not in key for key in keys):
+        # Batch entries are single-image receipts; multi-page receipts go through /ocr
+        return create_error_response(400, 'keys must be single-page upload keys')
+    keys = list(dict.fromkeys(keys))
+    deadline = get_deadline(context)
+    executor = ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(keys)))
+    gates = [WriteGate() for _ in keys]
+    futures = [
+        executor.submit(process_batch_receipt, key, preprocess, deadline, gate)
+        for key, gate in zip(keys, gates)
+    ]
+    wait(futures, timeout=max(0, deadline - time.monotonic()))
+    results = []
+    for key, gate, future in zip(keys, gates, futures):
+        if future.done() or not gate.claim('abandoned'):
+            # Finished, or already writing; writes started inside WRITE_MARGIN_SECONDS
+            # of the deadline, so waiting for them still fits in the response margin
+            results.append(future.result())
+        else:
+            # Still queued or mid-Textract; the gate stops it writing later
+            future.cancel()
+            results.append(unprocessed_result(key))
+    executor.shutdown(wait=False)
+    # Recorded from the main thread since the shared changes table resource isn't thread-safe
+    for result in results:
+        if result['status'] == 'ok':
+            try:
+                record_change(result['key'], 'receipt', 'ocr', result['key'], {'item_count': result['item_count']})
+            except ClientError as e:
+                # Writes are idempotent, so a retry re-runs the receipt and records the change
+                result.update({'status': 'error', 'error': str(e)})
+    failed = [result['key'] for result in results if result['status'] == 'error']
+    unprocessed = [result['key'] for result in results if result['status'] == 'unprocessed']
+    processed = len(keys) - len(failed) - len(unprocessed)
+    status_code = 200 if processed == len(keys) else 207
+    return create_response(status_code, {
+        'message': f'Processed {processed} of {len(keys)} receipts',
+        'data': results,
+        'failed': failed,
+        'unprocessed': unprocessed,
+    })
@@ -0,0 +1,156 @@
+import io
+import os
+import sys
+import time
+
+try:
+    from PIL import Image, ImageOps, ImageStat
+except ImportError:
+    Image = None
+    ImageOps = None
+    ImageStat = None
+
+RECEIPT_WIDTH_INCHES = 3.125 # Standard 80mm thermal receipt paper
+TARGET_DPI = int(os.environ.get('OCR_TARGET_DPI', '200'))
+JPEG_QUALITY = int(os.environ.get('OCR_JPEG_QUALITY', '85'))
+CROP_THUMBNAIL_SIZE = 256
+DECODE_MAX_SIDE = 4096 # Plenty to crop and downscale a receipt to the target DPI
+CROP_MIN_AREA = 0.2 # Don't crop to regions smaller than 20% of the photo (likely glare)
+CROP_MARGIN = 0.02
+
+def is_available():
+    return Image is not None
+
+class StageTimer:
+    def __init__(self):
+        self.timings = {}
+
+    def run(self, name, fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        self.timings[name] = round((time.perf_counter() - start) * 1000, 2)
+        return result
+
+def decode(data):
+    # Image.open is lazy, load() forces the actual decode into this stage
+    image = Image.open(io.BytesIO(data))
+    if max(image.size) > DECODE_MAX_SIDE:
+        # JPEGs can decode straight to 1/2, 1/4 or 1/8 scale, which keeps
+        # multipart-sized photos within Lambda memory; other formats ignore this
+        scale = DECODE_MAX_SIDE / max(image.size)
+        image.draft(image.mode, (int(image.width * scale), int(image.height * scale)))
+    image.load()
+    return image
+
+def exif_rotate(image):
+    return ImageOps.exif_transpose(image)
+
+def to_8bit(image):
+    # reduce() and the JPEG encoder only take 8-bit modes; palette screenshots
+    # and 16-bit scans are common uploads
+    if image.mode in ('L', 'RGB'):
+        return image
+    if image.mode.startswith('I'):
+        # Converting 16-bit samples directly clips them all to white
+        return image.convert('I').point(lambda p: p / 256).convert('L')
+    return image.convert('RGB')
+
+def crop_to_receipt(image):
+    # Receipts are bright paper on a darker background, so threshold a small
+    # thumbnail and crop to the bounding box of the bright region
+    factor = max(1, max(image.width, image.height) // CROP_THUMBNAIL_SIZE)
+    thumb = image.reduce(factor)
+    thumb.thumbnail((CROP_THUMBNAIL_SIZE, CROP_THUMBNAIL_SIZE))
+    thumb = ImageOps.autocontrast(thumb.convert('L'))
+    threshold = ImageStat.Stat(thumb).mean[0]
+    bbox = thumb.point(lambda p: 255 if p > threshold else 0).getbbox()
+    if not bbox:
+        return image
+    left, top, right, bottom = bbox
+    if (right - left) * (bottom - top) < CROP_MIN_AREA * thumb.width * thumb.height:
+        return image
+    scale_x = image.width / thumb.width
+    scale_y = image.height / thumb.height
+    margin_x = int(image.width * CROP_MARGIN)
+    margin_y = int(image.height * CROP_MARGIN)
+    return image.crop((
+        max(0, int(left * scale_x) - margin_x),
+        max(0, int(top * scale_y) - margin_y),
+        min(image.width, int(right * scale_x) + margin_x),
+        min(image.height, int(bottom * scale_y) + margin_y),
+    ))
+
+def grayscale(image):
+    return image.convert('L')
+
+def downscale(image, dpi=TARGET_DPI):
+    # Only ever shrink; upscaling adds bytes without adding detail
+    max_width = int(RECEIPT_WIDTH_INCHES * dpi)
+    if image.width <= max_width:
+        return image
+    height = int(image.height * max_width / image.width)
+    return image.resize((max_width, height), Image.LANCZOS)
+
+def encode(image, quality=JPEG_QUALITY):
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=quality, optimize=True)
+    return buffer.getvalue()
+
+def preprocess_image(data, dpi=TARGET_DPI, quality=JPEG_QUALITY):
+    if not is_available():
+        raise RuntimeError('Pillow is not installed')
+    timer = StageTimer()
+    image = timer.run('decode', decode, data)
+    image = timer.run('exif_rotate', exif_rotate, image)
+    image = timer.run('to_8bit', to_8bit, image)
+    image = timer.run('crop', crop_to_receipt, image)
+    image = timer.run('grayscale', grayscale, image)
+    image = timer.run('downscale', downscale, image, dpi)
+    output = timer.run('encode', encode, image, quality)
+    stats = {
+        'timings_ms': timer.timings,
+        'input_bytes': len(data),
+        'output_bytes': len(output),
+        'output_size': [image.width, image.height],
+    }
+    return output, stats
+
+def textract_words(data):
+    import boto3
+    start = time.perf_counter()
+    response = boto3.client('textract').detect_document_text(Document={'Bytes': data})
+    elapsed = round((time.perf_counter() - start) * 1000, 2)
+    words = [block['Text'] for block in response['Blocks'] if block['BlockType'] == 'WORD']
+    return words, elapsed
+
+if __name__ == '__main__':
+    # Offline benchmark: python preprocess.py sample1.jpg [--dpi 200] [--out DIR] [--textract]
+    args = sys.argv[1:]
+    dpi = TARGET_DPI
+    out_dir = None
+    compare = '--textract' in args
+    if compare:
+        args.remove('--textract')
+    if '--dpi' in args:
+        i = args.index('--dpi')
+        dpi = int(args[i + 1])
+        del args[i:i + 2]
+    if '--out' in args:
+        i = args.index('--out')
+        out_dir = args[i + 1]
+        del args[i:i + 2]
+    for path in args:
+        with open(path, 'rb') as f:
+            data = f.read()
+        output, stats = preprocess_image(data, dpi=dpi)
+        print(path, stats)
+        if compare:
+            raw_words, raw_ms = textract_words(data)
+            new_words, new_ms = textract_words(output)
+            print('  textract raw: %d words in %sms' % (len(raw_words), raw_ms))
+            print('  textract preprocessed: %d words in %sms' % (len(new_words), new_ms))
+            print('  words lost: %s' % sorted(set(raw_words) - set(new_words)))
+        if out_dir:
+            name = os.path.splitext(os.path.basename(path))[0] + '.jpg'
+            with open(os.path.join(out_dir, name), 'wb') as f:
+                f.write(output)
@@ -1,44 +1,88 @@
 import json
 import uuid
-import boto3
-from boto3.dynamodb.conditions import Key
+import datetime
+from boto3.dynamodb.conditions import Key, Attr
 from botocore.exceptions import ClientError
 from http_utils import create_response, create_error_response
 from price_utils import formatPrice
 from auth_utils import authenticate
+from change_utils import record_change
+from db_utils import Role, role_repository, receipt_repository, user_repository
+from cache_utils import TTLCache
 
-table = boto3.resource('dynamodb').Table('roles')
+# Short TTL since profile edits go through a different Lambda and can't invalidate this one
+user_cache = TTLCache('users', maxsize=1024, ttl=10)
+
+def is_condition_failure(e):
+    return e.response['Error']['Code'] == 'ConditionalCheckFailedException'
+
+def update_participant_count(receipt_id, delta):
+    # Denormalized onto the receipt so history listings don't need to query roles
+    try:
+        receipt_repository.increment({'id': receipt_id}, 'participant_count', delta)
+    except ClientError as e:
+        print(f'Failed to update participant count for {receipt_id}: {e}')
 
 @authenticate
 def post(event, context):
     user = event['user']
     receipt_id = event['pathParameters']['receipt_id']
     data = json.loads(event['body'])
-    item = {
-        'id': uuid.uuid4().hex,
-        'receipt_id': receipt_id,
-        'user_id': user['id'],
-        'role': data.get('role', 'unauthorized'),
-    }
-    table.put_item(Item=item)
-    return create_response(201, {'message': 'Item created', 'data': item})
+    role = Role(
+        id=uuid.uuid4().hex,
+        receipt_id=receipt_id,
+        user_id=user['id'],
+        role=data.get('role', 'unauthorized'),
+        created_at=datetime.datetime.utcnow().isoformat()
+    )
+    try:
+        role_repository.put(role, condition=Attr('user_id').not_exists())
+    except ClientError as e:
+        if not is_condition_failure(e):
+            return create_error_response(500, str(e))
+        # Re-joining only changes the role; id, created_at and total are kept
+        try:
+            role = role_repository.update(
+                {'receipt_id': receipt_id, 'user_id': user['id']},
+                {'role': role.role},
+                condition=Attr('user_id').exists(),
+                return_new=True
+            )
+        except ClientError as e:
+            if is_condition_failure(e):
+                return create_error_response(409, 'Role was removed concurrently, retry')
+            return create_error_response(500, str(e))
+        try:
+            record_change(receipt_id, 'role', 'update', user['id'], {'role': role.role})
+        except ClientError as e:
+            return create_error_response(500, str(e))
+        return create_response(200, {'message': 'Item updated', 'data': role.to_item()})
+    update_participant_count(receipt_id, 1)
+    try:
+        record_change(receipt_id, 'role', 'put', user['id'], role.to_item())
+    except ClientError as e:
+        return create_error_response(500, str(e))
+    return create_response(201, {'message': 'Item created', 'data': role.to_item()})
 
 @authenticate
 def get_receipt_participants(event, context):
-    users_table = boto3.resource('dynamodb').Table('users')
     receipt_id = event['pathParameters']['receipt_id']
-    response = table.query(
-        KeyConditionExpression=Key('receipt_id').eq(receipt_id)
+    roles = role_repository.query(Key('receipt_id').eq(receipt_id), projection='participant')
+    user_ids = list(dict.fromkeys(role.user_id for role in roles))
+    users = user_cache.get_many_or_load(
+        user_ids,
+        lambda missing: {user.id: user.to_item() for user in user_repository.batch_get([{'id': user_id} for user_id in missing])}
     )
-    items = response['Items']
+    user_cache.log_stats()
     hosts = []
     consumers = []
-    for item in items:
-        user = users_table.get_item(Key={'id': item['user_id']})
-        if item['role'] == 'host':
-            hosts.append(user['Item'])
+    for role in roles:
+        if role.user_id not in users:
+            continue
+        if role.role == 'host':
+            hosts.append(users[role.user_id])
         else:
-            consumers.append(user['Item'])
+            consumers.append(users[role.user_id])
     return create_response(200, {'data': {'hosts': hosts, 'consumers': consumers}})
 
 @authenticate
@@ -46,11 +90,11 @@ def get(event, context):
     user = event['user']
     receipt_id = event['pathParameters']['receipt_id']
     try:
-        response = table.get_item(Key={'receipt_id': receipt_id, 'user_id': user['id']})
+        role = role_repository.get({'receipt_id': receipt_id, 'user_id': user['id']})
     except ClientError as e:
         return create_error_response(500, str(e))
-    if 'Item' in response:
-        return create_response(200, {'data': response['Item']})
+    if role:
+        return create_response(200, {'data': role.to_item()})
     return create_error_response(404, 'Item not found')
 
 @authenticate
@@ -58,27 +102,41 @@ def update(event, context):
     user = event['user']
     receipt_id = event['pathParameters']['receipt_id']
     data = json.loads(event['body'])
-    update_expression = "SET "
-    expression_attribute_values = {}
+    fields = {}
     if 'role' in data:
-        update_expression += "#role = :role, "
-        expression_attribute_values[':role'] = data['role']
-    update_expression = update_expression.rstrip(", ")
-    expression_attribute_names = {
-        "#role": "role",
-    }
-    table.update_item(
-        Key={'receipt_id': receipt_id, 'user_id': user['id']},
-        UpdateExpression=update_expression,
-        ExpressionAttributeNames=expression_attribute_names,
-        ExpressionAttributeValues=expression_attribute_values
-    )
+        fields['role'] = data['role']
+    if 'total' in data:
+        try:
+            fields['total'] = data['total'] = formatPrice(float(data['total']))
+        except (TypeError, ValueError):
+            return create_error_response(400, 'total must be a number')
+    if not fields:
+        return create_error_response(400, 'No updatable fields provided')
+    try:
+        # Roles are only created by post, which also counts the participant
+        role_repository.update(
+            {'receipt_id': receipt_id, 'user_id': user['id']},
+            fields,
+            condition=Attr('user_id').exists()
+        )
+    except ClientError as e:
+        if is_condition_failure(e):
+            return create_error_response(404, 'Item not found')
+        return create_error_response(500, str(e))
+    try:
+        record_change(receipt_id, 'role', 'update', user['id'], fields)
+    except ClientError as e:
+        return create_error_response(500, str(e))
     return create_response(200, {'message': 'Item updated', 'data': data})
 
 @authenticate
 def delete_by_id(event, context):
     user = event['user']
     receipt_id = event['pathParameters']['receipt_id']
-    table.delete_item(Key={'receipt_id': receipt_id, 'user_id': user['id']})
+    if role_repository.delete({'receipt_id': receipt_id, 'user_id': user['id']}, return_old=True):
+        update_participant_count(receipt_id, -1)
+    try:
+        record_change(receipt_id, 'role', 'delete', user['id'])
+    except ClientError as e:
+        return create_error_response(500, str(e))
     return create_response(200, {"message": "Item deleted"})
-    
\ No newline at end of file
@@ -0,0 +1,101 @@
+import sys
+import boto3
+from botocore.exceptions import ClientError
+from boto3.dynamodb.conditions import Key
+
+# One-off backfill for the receipt history listing. Roles written before
+# created_at existed are missing from the rolesByUser index, and receipts
+# created before participant_count was maintained read as 0 participants.
+#
+#   python backend/scripts/backfill_history.py [--dry-run]
+#
+# Safe to re-run: every write is conditional on the attribute still being missing.
+
+# Sorts before any real ISO timestamp, so backfilled roles list as the oldest history
+LEGACY_CREATED_AT = '1970-01-01T00:00:00'
+
+dynamodb = boto3.resource('dynamodb')
+roles_table = dynamodb.Table('roles')
+receipts_table = dynamodb.Table('receipts')
+
+def scan(table, fields):
+    names = {f'#p{i}': field for i, field in enumerate(fields)}
+    kwargs = {'ProjectionExpression': ', '.join(names), 'ExpressionAttributeNames': names}
+    while True:
+        response = table.scan(**kwargs)
+        yield from response['Items']
+        if 'LastEvaluatedKey' not in response:
+            return
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def is_condition_failure(e):
+    return e.response['Error']['Code'] == 'ConditionalCheckFailedException'
+
+def count_roles(receipt_id):
+    count = 0
+    kwargs = {'KeyConditionExpression': Key('receipt_id').eq(receipt_id), 'Select': 'COUNT'}
+    while True:
+        response = roles_table.query(**kwargs)
+        count += response['Count']
+        if 'LastEvaluatedKey' not in response:
+            return count
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def backfill_roles(dry_run):
+    updated = 0
+    for role in scan(roles_table, ['receipt_id', 'user_id', 'created_at']):
+        if 'created_at' in role:
+            continue
+        updated += 1
+        if dry_run:
+            continue
+        try:
+            roles_table.update_item(
+                Key={'receipt_id': role['receipt_id'], 'user_id': role['user_id']},
+                UpdateExpression='SET #created_at = :created_at',
+                ConditionExpression='attribute_not_exists(#created_at)',
+                ExpressionAttributeNames={'#created_at': 'created_at'},
+                ExpressionAttributeValues={':created_at': LEGACY_CREATED_AT}
+            )
+        except ClientError as e:
+            if not is_condition_failure(e):
+                raise
+    return updated
+
+def backfill_receipts(dry_run):
+    updated = 0
+    for receipt in scan(receipts_table, ['id', 'participant_count']):
+        if 'participant_count' in receipt:
+            continue
+        updated += 1
+        if dry_run:
+            continue
+        key = {'id': receipt['id']}
+        update = {
+            'UpdateExpression': 'SET #count = :count',
+            'ExpressionAttributeNames': {'#count': 'participant_count'},
+        }
+        try:
+            receipts_table.update_item(
+                Key=key,
+                ConditionExpression='attribute_not_exists(#count)',
+                ExpressionAttributeValues={':count': count_roles(receipt['id'])},
+                **update
+            )
+        except ClientError as e:
+            if not is_condition_failure(e):
+                raise
+            # A role was posted meanwhile and its ADD started the counter at 1,
+            # so recount to include the roles that predate the counter
+            receipts_table.update_item(
+                Key=key,
+                ExpressionAttributeValues={':count': count_roles(receipt['id'])},
+                **update
+            )
+    return updated
+
+if __name__ == '__main__':
+    dry_run = '--dry-run' in sys.argv[1:]
+    prefix = 'Would backfill' if dry_run else 'Backfilled'
+    print(f'{prefix} created_at on {backfill_roles(dry_run)} roles')
+    print(f'{prefix} participant_count on {backfill_receipts(dry_run)} receipts')
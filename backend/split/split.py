@@ -1,12 +1,11 @@
 import json
 import uuid
-import boto3
 from botocore.exceptions import ClientError
 from boto3.dynamodb.conditions import Key
 from auth_utils import authenticate
+from change_utils import record_change
 from http_utils import create_response, create_error_response
-
-table = boto3.resource('dynamodb').Table('splits')
+from db_utils import Split, split_repository
 
 @authenticate
 def get(event, context):
@@ -16,43 +15,44 @@ def get(event, context):
     user = event['user']
     receipt_id = event['pathParameters']['receipt_id']
     if only_mine:
-        response = table.query(
-            IndexName="splitsByUser",
-            KeyConditionExpression=Key("receipt_id").eq(receipt_id) & Key("user_id").eq(user['id'])
+        splits = split_repository.query(
+            Key("receipt_id").eq(receipt_id) & Key("user_id").eq(user['id']),
+            index="splitsByUser"
         )
     else:
-        response = table.query(
-            KeyConditionExpression=Key('receipt_id').eq(receipt_id)
-        )
-    items = response['Items']
-    return create_response(200, {'data': items})
+        splits = split_repository.query(Key('receipt_id').eq(receipt_id))
+    return create_response(200, {'data': [split.to_item() for split in splits]})
 
 @authenticate
 def post(event, context):
     user = event['user']
     receipt_id = event['pathParameters']['receipt_id']
     data = json.loads(event['body'])
-    item = {
-        'id': uuid.uuid4().hex,
-        'receipt_id': receipt_id,
-        'quantity': str(data.get('quantity', 0)),
-        'split': str(data.get('split', 'auto')),
-        'user_id': user['id'],
-        'item_id': data.get('item_id', ''),
-    }
-    table.put_item(Item=item)
-    return create_response(201, {'message': 'Item created', 'data': item})
+    split = Split(
+        id=uuid.uuid4().hex,
+        receipt_id=receipt_id,
+        quantity=str(data.get('quantity', 0)),
+        split=str(data.get('split', 'auto')),
+        user_id=user['id'],
+        item_id=data.get('item_id', '')
+    )
+    try:
+        split_repository.put(split)
+        record_change(receipt_id, 'split', 'put', split.id, split.to_item())
+    except ClientError as e:
+        return create_error_response(500, str(e))
+    return create_response(201, {'message': 'Item created', 'data': split.to_item()})
 
 @authenticate
 def get_by_id(event, context):
     receipt_id = event['pathParameters']['receipt_id']
     id = event['pathParameters']['split_id']
     try:
-        response = table.get_item(Key={'receipt_id': receipt_id, 'id': id})
+        split = split_repository.get({'receipt_id': receipt_id, 'id': id})
     except ClientError as e:
         return create_error_response(500, str(e))
-    if 'Item' in response:
-        return create_response(200, {'data': response['Item']})
+    if split:
+        return create_response(200, {'data': split.to_item()})
     return create_error_response(404, "Item not found")
 
 @authenticate
@@ -60,33 +60,27 @@ def update_by_id(event, context):
     receipt_id = event['pathParameters']['receipt_id']
     id = event['pathParameters']['split_id']
     data = json.loads(event['body'])
-    update_expression = "SET "
-    expression_attribute_values = {}
+    fields = {}
     if 'split' in data:
-        data['split'] = str(int(data['split']))
-        update_expression += "#split = :split, "
-        expression_attribute_values[':split'] = data['split']
+        fields['split'] = data['split'] = str(int(data['split']))
     if 'quantity' in data:
-        data['quantity'] = str(int(data['quantity']))
-        update_expression += "#quantity = :quantity, "
-        expression_attribute_values[':quantity'] = data['quantity']
-    update_expression = update_expression.rstrip(", ")
-    expression_attribute_names = {
-        "#split": "split",
-        "#quantity": "quantity"
-    }
-    table.update_item(
-        Key={'receipt_id': receipt_id, 'id': id},
-        UpdateExpression=update_expression,
-        ExpressionAttributeNames=expression_attribute_names,
-        ExpressionAttributeValues=expression_attribute_values
-    )
+        fields['quantity'] = data['quantity'] = str(int(data['quantity']))
+    if not fields:
+        return create_error_response(400, 'No updatable fields provided')
+    try:
+        split_repository.update({'receipt_id': receipt_id, 'id': id}, fields)
+        record_change(receipt_id, 'split', 'update', id, fields)
+    except ClientError as e:
+        return create_error_response(500, str(e))
     return create_response(200, {'message': 'Item updated', 'data': data})
 
 @authenticate
 def delete_by_id(event, context):
     receipt_id = event['pathParameters']['receipt_id']
     id = event['pathParameters']['split_id']
-    table.delete_item(Key={'receipt_id': receipt_id, 'id': id})
+    try:
+        split_repository.delete({'receipt_id': receipt_id, 'id': id})
+        record_change(receipt_id, 'split', 'delete', id)
+    except ClientError as e:
+        return create_error_response(500, str(e))
     return create_response(200, {"message": "Item deleted"})
-    
\ No newline at end of file
@@ -0,0 +1,10 @@
+import os
+import sys
+
+BACKEND = os.path.join(os.path.dirname(__file__), '..')
+
+# Handlers import the middleware layer and their siblings as top-level modules,
+# as they do in Lambda
+for path in ['middleware_layer/python', 'ocr', 'change', 'upload', 'export']:
+    sys.path.insert(0, os.path.join(BACKEND, path))
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
@@ -0,0 +1,62 @@
+import cache_utils
+from cache_utils import TTLCache
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def make_cache(monkeypatch, **kwargs):
+    clock = Clock()
+    monkeypatch.setattr(cache_utils.time, 'monotonic', clock)
+    return TTLCache('test', **kwargs), clock
+
+def test_fresh_entry_skips_version_check(monkeypatch):
+    cache, clock = make_cache(monkeypatch, ttl=30, fresh_seconds=2)
+    versions = []
+    version = lambda: versions.append(1) or 1
+    assert cache.get_or_load('k', lambda: 'a', version) == 'a'
+    clock.now += 1
+    assert cache.get_or_load('k', lambda: 'b', version) == 'a'
+    assert len(versions) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_version_change_reloads(monkeypatch):
+    cache, clock = make_cache(monkeypatch, ttl=30, fresh_seconds=2)
+    cache.get_or_load('k', lambda: 'a', lambda: 1)
+    clock.now += 5
+    assert cache.get_or_load('k', lambda: 'b', lambda: 1) == 'a'
+    clock.now += 5
+    assert cache.get_or_load('k', lambda: 'b', lambda: 2) == 'b'
+
+def test_expired_entry_reloads(monkeypatch):
+    cache, clock = make_cache(monkeypatch, ttl=5)
+    cache.get_or_load('k', lambda: 'a')
+    clock.now += 6
+    assert cache.get_or_load('k', lambda: 'b') == 'b'
+
+def test_missing_value_is_not_cached(monkeypatch):
+    cache, _ = make_cache(monkeypatch)
+    assert cache.get_or_load('k', lambda: None) is None
+    assert 'k' not in cache.entries
+
+def test_lru_eviction(monkeypatch):
+    cache, _ = make_cache(monkeypatch, maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get_or_load('a', lambda: None)
+    cache.set('c', 3)
+    assert list(cache.entries) == ['a', 'c']
+    assert cache.evictions == 1
+
+def test_get_many_loads_only_missing(monkeypatch):
+    cache, _ = make_cache(monkeypatch)
+    cache.set('a', 1)
+    requested = []
+    def loader(keys):
+        requested.extend(keys)
+        return {key: key.upper() for key in keys}
+    assert cache.get_many_or_load(['a', 'b'], loader) == {'a': 1, 'b': 'B'}
+    assert requested == ['b']
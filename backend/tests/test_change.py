@@ -0,0 +1,54 @@
+import pytest
+from botocore.exceptions import ClientError
+import change
+import change_utils
+
+def changes(*seqs):
+    return [{'seq': seq} for seq in seqs]
+
+def test_contiguous_changes_from_since():
+    assert change.contiguous_changes(changes(4, 5, 6), 3) == changes(4, 5, 6)
+
+def test_contiguous_changes_stop_at_first_hole():
+    assert change.contiguous_changes(changes(4, 5, 7, 8), 3) == changes(4, 5)
+
+@pytest.mark.parametrize('retained', [changes(), changes(5, 6)])
+def test_contiguous_changes_fall_back_to_snapshot(retained):
+    assert change.contiguous_changes(retained, 3) is None
+
+def throttled():
+    return ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'slow down'}}, 'UpdateItem')
+
+class FlakyTable:
+    def __init__(self, failures):
+        self.failures = failures
+        self.puts = []
+
+    def update_item(self, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise throttled()
+        return {'Attributes': {'latest': 7}}
+
+    def put_item(self, Item):
+        self.puts.append(Item)
+
+@pytest.fixture
+def table(monkeypatch):
+    def make(failures):
+        table = FlakyTable(failures)
+        monkeypatch.setattr(change_utils, 'changes_table', table)
+        monkeypatch.setattr(change_utils.time, 'sleep', lambda seconds: None)
+        return table
+    return make
+
+def test_record_change_retries_the_seq_bump(table):
+    changes_table = table(change_utils.SEQ_ATTEMPTS - 1)
+    assert change_utils.record_change('r1', 'item', 'put', 'i1') == 7
+    assert changes_table.puts[0]['seq'] == 7
+
+def test_record_change_propagates_a_failed_seq_bump(table):
+    changes_table = table(change_utils.SEQ_ATTEMPTS)
+    with pytest.raises(ClientError):
+        change_utils.record_change('r1', 'item', 'put', 'i1')
+    assert changes_table.puts == []
@@ -0,0 +1,72 @@
+import pytest
+from botocore.exceptions import ClientError
+import db_utils
+from db_utils import Receipt, Repository, build_update
+
+def test_build_update_empty():
+    assert build_update({}) is None
+
+def test_build_update_uses_placeholders():
+    update = build_update({'name': 'Tacos', 'price': '4.50'})
+    assert update == {
+        'UpdateExpression': 'SET #f0 = :v0, #f1 = :v1',
+        'ExpressionAttributeNames': {'#f0': 'name', '#f1': 'price'},
+        'ExpressionAttributeValues': {':v0': 'Tacos', ':v1': '4.50'},
+    }
+
+def test_model_keeps_unknown_attributes():
+    item = {'id': 'r1', 'grand_total': '12.00', 'tip': '2.00'}
+    receipt = Receipt.from_item(item)
+    assert receipt.grand_total == '12.00'
+    assert receipt.image_url is None
+    assert receipt.extra == {'tip': '2.00'}
+    assert receipt.to_item() == item
+
+def test_default_projection_reads_whole_item():
+    repository = Repository('receipts', Receipt, {'summary': ('id', 'grand_total')})
+    assert repository._read_options('default', False) == {}
+    summary = repository._read_options('summary', True)
+    assert summary['ProjectionExpression'] == '#p0, #p1'
+    assert summary['ConsistentRead'] is True
+
+class ThrottledDynamoDB:
+    # Leaves the last key unprocessed on the first `throttled` calls
+    def __init__(self, throttled):
+        self.throttled = throttled
+        self.calls = 0
+
+    def batch_get_item(self, RequestItems):
+        self.calls += 1
+        request = RequestItems['receipts']
+        keys = request['Keys']
+        if self.calls <= self.throttled:
+            return {
+                'Responses': {'receipts': keys[:-1]},
+                'UnprocessedKeys': {'receipts': {**request, 'Keys': keys[-1:]}},
+            }
+        return {'Responses': {'receipts': keys}, 'UnprocessedKeys': {}}
+
+class FakeTable:
+    name = 'receipts'
+
+def batch_repository(monkeypatch, throttled):
+    repository = Repository('receipts', Receipt)
+    repository.table = FakeTable()
+    fake = ThrottledDynamoDB(throttled)
+    sleeps = []
+    monkeypatch.setattr(db_utils, 'dynamodb', fake)
+    monkeypatch.setattr(db_utils.time, 'sleep', sleeps.append)
+    return repository, fake, sleeps
+
+def test_batch_get_backs_off_on_unprocessed_keys(monkeypatch):
+    repository, fake, sleeps = batch_repository(monkeypatch, throttled=2)
+    receipts = repository.batch_get([{'id': 'r1'}, {'id': 'r2'}])
+    assert sorted(receipt.id for receipt in receipts) == ['r1', 'r2']
+    assert fake.calls == 3
+    assert len(sleeps) == 2
+
+def test_batch_get_gives_up_after_max_attempts(monkeypatch):
+    repository, fake, _ = batch_repository(monkeypatch, throttled=100)
+    with pytest.raises(ClientError):
+        repository.batch_get([{'id': 'r1'}, {'id': 'r2'}])
+    assert fake.calls == db_utils.BATCH_GET_MAX_ATTEMPTS
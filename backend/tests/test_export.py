@@ -0,0 +1,60 @@
+import csv
+import io
+import json
+from decimal import Decimal
+import export
+
+def test_parts_are_at_least_part_size_except_the_last(monkeypatch):
+    monkeypatch.setattr(export, 'PART_SIZE', 10)
+    parts = list(export.iter_parts([b'abcd'] * 6))
+    assert parts == [b'abcdabcdabcd', b'abcdabcdabcd']
+    assert list(export.iter_parts([b'abc'])) == [b'abc']
+    assert list(export.iter_parts([])) == []
+
+def test_csv_has_a_header_and_blank_missing_columns():
+    rows = [{'record_type': 'receipt', 'receipt_id': 'r1', 'grand_total': Decimal('12.5')}]
+    lines = list(csv.DictReader(io.StringIO(b''.join(export.iter_csv(rows)).decode())))
+    assert lines[0]['record_type'] == 'receipt'
+    assert lines[0]['grand_total'] == '12.5'
+    assert lines[0]['item_id'] == ''
+
+def test_csv_of_no_rows_is_just_the_header():
+    assert b''.join(export.iter_csv([])).decode().strip() == ','.join(export.COLUMNS)
+
+def test_jsonl_encodes_dynamodb_numbers():
+    rows = [{'participant_count': Decimal('3'), 'total': Decimal('4.25')}]
+    assert [json.loads(line) for line in export.iter_jsonl(rows)] == [{'participant_count': 3, 'total': 4.25}]
+
+class FakeS3:
+    def __init__(self):
+        self.calls = []
+
+    def create_multipart_upload(self, **kwargs):
+        self.calls.append('create')
+        return {'UploadId': 'u1'}
+
+    def upload_part(self, **kwargs):
+        self.calls.append(('part', kwargs['PartNumber']))
+        return {'ETag': f'"{kwargs["PartNumber"]}"'}
+
+    def complete_multipart_upload(self, **kwargs):
+        self.calls.append(('complete', len(kwargs['MultipartUpload']['Parts'])))
+
+    def abort_multipart_upload(self, **kwargs):
+        self.calls.append('abort')
+
+    def put_object(self, **kwargs):
+        self.calls.append(('put', kwargs['Body']))
+
+def test_empty_export_is_written_as_an_empty_object(monkeypatch):
+    s3 = FakeS3()
+    monkeypatch.setattr(export, 's3', s3)
+    export.upload_stream('exports/u1/j1.csv', 'text/csv', iter([]))
+    assert s3.calls == ['create', 'abort', ('put', b'')]
+
+def test_export_uploads_each_part(monkeypatch):
+    s3 = FakeS3()
+    monkeypatch.setattr(export, 's3', s3)
+    monkeypatch.setattr(export, 'PART_SIZE', 4)
+    export.upload_stream('exports/u1/j1.csv', 'text/csv', iter([b'abcd', b'ef']))
+    assert s3.calls == ['create', ('part', 1), ('part', 2), ('complete', 2)]
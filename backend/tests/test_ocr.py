@@ -0,0 +1,57 @@
+import pytest
+import ocr
+
+def test_item_ids_are_stable_per_receipt_and_index():
+    assert ocr.item_id('r1', 0) == ocr.item_id('r1', 0)
+    assert ocr.item_id('r1', 0) != ocr.item_id('r1', 1)
+    assert ocr.item_id('r1', 0) != ocr.item_id('r2', 0)
+
+def test_write_gate_is_decided_once():
+    gate = ocr.WriteGate()
+    assert gate.claim('writing')
+    assert not gate.claim('abandoned')
+    gate = ocr.WriteGate()
+    assert gate.claim('abandoned')
+    assert not gate.claim('writing')
+
+def test_page_keys_are_deduplicated_and_ordered_numerically():
+    keys = ['pages/r1/10', 'pages/r1/2', 'pages/r1/2']
+    assert ocr.page_keys_for('r1', keys) == ['pages/r1/2', 'pages/r1/10']
+
+@pytest.mark.parametrize('keys', [
+    None,
+    [],
+    'pages/r1/0',
+    ['pages/r2/0'],
+    ['pages/r1/x'],
+    ['pages/r1/'],
+    [7],
+])
+def test_page_keys_rejects_foreign_or_malformed_keys(keys):
+    with pytest.raises(ValueError):
+        ocr.page_keys_for('r1', keys)
+
+class FakeTextract:
+    def __init__(self):
+        self.keys = []
+
+    def detect_document_text(self, Document):
+        self.keys.append(Document['S3Object']['Name'])
+        return {'Blocks': []}
+
+def test_oversized_page_is_preprocessed_even_when_disabled(monkeypatch):
+    textract = FakeTextract()
+    monkeypatch.setattr(ocr, 'textract', textract)
+    monkeypatch.setattr(ocr, 'is_oversized', lambda key: True)
+    monkeypatch.setattr(ocr, 'normalize_upload', lambda key, timings: f'normalized/{key}.jpg')
+    ocr.ocr_page('r1', False, {})
+    assert textract.keys == ['normalized/r1.jpg']
+
+def test_oversized_page_does_not_fall_back_to_the_original(monkeypatch):
+    def fail(key, timings):
+        raise OSError('cannot identify image file')
+    monkeypatch.setattr(ocr, 'textract', FakeTextract())
+    monkeypatch.setattr(ocr, 'is_oversized', lambda key: True)
+    monkeypatch.setattr(ocr, 'normalize_upload', fail)
+    with pytest.raises(OSError):
+        ocr.ocr_page('r1', True, {})
@@ -0,0 +1,21 @@
+import io
+import pytest
+
+Image = pytest.importorskip('PIL.Image')
+import preprocess
+
+def png(image):
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+@pytest.mark.parametrize('mode, fill', [('P', 5), ('I;16', 50000), ('RGBA', (200, 200, 200, 255)), ('1', 1)])
+def test_preprocess_accepts_non_8bit_modes(mode, fill):
+    output, stats = preprocess.preprocess_image(png(Image.new(mode, (1200, 2400), fill)))
+    assert Image.open(io.BytesIO(output)).mode == 'L'
+    assert stats['output_size'] == [625, 1250]
+
+def test_16bit_samples_are_scaled_not_clipped():
+    image = preprocess.to_8bit(Image.new('I;16', (4, 4), 30000))
+    assert image.mode == 'L'
+    assert image.getpixel((0, 0)) == 117
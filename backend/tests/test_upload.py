@@ -0,0 +1,50 @@
+import pytest
+import upload
+
+def test_sizes_default_to_unknown():
+    assert upload.parse_sizes({}, 3) == [None, None, None]
+
+def test_sizes_parse_one_per_page():
+    assert upload.parse_sizes({'sizes': '100,20000000'}, 2) == [100, 20000000]
+
+@pytest.mark.parametrize('sizes, count', [
+    ('100', 2),
+    ('0', 1),
+    (str(upload.MAX_MULTIPART_BYTES + 1), 1),
+    ('abc', 1),
+])
+def test_sizes_reject_bad_input(sizes, count):
+    with pytest.raises(ValueError):
+        upload.parse_sizes({'sizes': sizes}, count)
+
+def test_parts_are_sorted_and_renamed_for_s3():
+    parts = [{'part_number': '2', 'etag': '"b"'}, {'part_number': 1, 'etag': '"a"'}]
+    assert upload.parse_parts(parts) == [
+        {'PartNumber': 1, 'ETag': '"a"'},
+        {'PartNumber': 2, 'ETag': '"b"'},
+    ]
+
+@pytest.mark.parametrize('parts', [
+    None,
+    [],
+    [{'part_number': 1}],
+    [{'part_number': 'one', 'etag': '"a"'}],
+    ['etag'],
+])
+def test_parts_reject_bad_input(parts):
+    with pytest.raises(ValueError):
+        upload.parse_parts(parts)
+
+def test_single_upload_keeps_the_receipt_id_as_key():
+    assert upload.page_key('r1', 0, 1) == 'r1'
+    assert upload.page_key('r1', 1, 2) == 'pages/r1/1'
+
+@pytest.mark.parametrize('key, valid', [
+    ('0' * 32, True),
+    ('pages/' + '0' * 32 + '/3', True),
+    ('normalized/' + '0' * 32 + '.jpg', False),
+    ('pages/' + '0' * 32 + '/3/x', False),
+    ('../' + '0' * 32, False),
+])
+def test_only_issued_keys_can_be_completed(key, valid):
+    assert bool(upload.UPLOAD_KEY_PATTERN.match(key)) is valid
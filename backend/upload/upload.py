@@ -1,17 +1,169 @@
 import os
+import re
 import json
+import math
 import uuid
 import boto3
-from http_utils import create_response
+from botocore.exceptions import ClientError
+from http_utils import create_response, create_error_response
 from auth_utils import authenticate
 
 s3 = boto3.client('s3')
 BUCKET_NAME = os.environ.get('BUCKET_NAME')
 
+URL_EXPIRY_SECONDS = 900
+MAX_PAGES = 10
+MAX_POST_BYTES = 10 * 1024 * 1024 # Larger pages get a multipart upload instead
+MAX_MULTIPART_BYTES = 50 * 1024 * 1024
+# Textract reads pages up to this size as uploaded; /ocr always downscales larger ones first
+OCR_MAX_BYTES = 10 * 1024 * 1024
+PART_SIZE = 5 * 1024 * 1024 # S3 minimum for every part but the last
+# Textract's DetectDocumentText only reads JPEG, PNG, PDF and TIFF
+ALLOWED_CONTENT_TYPES = ['image/jpeg', 'image/png']
+# Only keys this endpoint hands out can be completed
+UPLOAD_KEY_PATTERN = re.compile(r'^(?:[0-9a-f]{32}|pages/[0-9a-f]{32}/\d+)$')
+
+def file_url(key):
+    return f'https://{BUCKET_NAME}.s3.amazonaws.com/{key}'
+
+def page_key(receipt_id, page, count):
+    # Single uploads keep the bare id as the key so /ocr can use it as the receipt id;
+    # pages of a multi-page receipt live under pages/ and are OCR'd together
+    if count == 1:
+        return receipt_id
+    return f'pages/{receipt_id}/{page}'
+
+def parse_sizes(params, count):
+    if not params.get('sizes'):
+        return [None] * count
+    sizes = [int(size) for size in params['sizes'].split(',')]
+    if len(sizes) != count:
+        raise ValueError('sizes must have one entry per page')
+    if any(size < 1 or size > MAX_MULTIPART_BYTES for size in sizes):
+        raise ValueError(f'each size must be between 1 and {MAX_MULTIPART_BYTES} bytes')
+    return sizes
+
+def presigned_post(key, content_type):
+    post = s3.generate_presigned_post(
+        BUCKET_NAME, key,
+        Fields={'Content-Type': content_type},
+        Conditions=[
+            ['content-length-range', 1, MAX_POST_BYTES],
+            {'Content-Type': content_type},
+        ],
+        ExpiresIn=URL_EXPIRY_SECONDS
+    )
+    return {'key': key, 'presigned_url': post, 'file_url': file_url(key)}
+
+def multipart_upload(key, content_type, size):
+    upload_id = s3.create_multipart_upload(
+        Bucket=BUCKET_NAME, Key=key, ContentType=content_type
+    )['UploadId']
+    parts = [
+        {
+            'part_number': part_number,
+            'url': s3.generate_presigned_url(
+                'upload_part',
+                Params={'Bucket': BUCKET_NAME, 'Key': key, 'UploadId': upload_id, 'PartNumber': part_number},
+                ExpiresIn=URL_EXPIRY_SECONDS
+            )
+        }
+        for part_number in range(1, math.ceil(size / PART_SIZE) + 1)
+    ]
+    return {
+        'key': key,
+        'upload_id': upload_id,
+        'part_size': PART_SIZE,
+        'parts': parts,
+        'file_url': file_url(key),
+    }
+
 @authenticate
 def presigned_url(event, context):
-    file_name = uuid.uuid4().hex
-    presigned_url = s3.generate_presigned_post(
-        BUCKET_NAME, file_name, ExpiresIn=3600
-    )
-    return create_response(200, {'presigned_url': presigned_url, 'file_url': f'https://{BUCKET_NAME}.s3.amazonaws.com/{file_name}'})
\ No newline at end of file
+    params = event.get('queryStringParameters') or {}
+    try:
+        count = int(params.get('count', 1))
+    except ValueError:
+        return create_error_response(400, 'count must be an integer')
+    if count < 1 or count > MAX_PAGES:
+        return create_error_response(400, f'count must be between 1 and {MAX_PAGES}')
+    content_type = params.get('content_type', 'image/jpeg')
+    if content_type not in ALLOWED_CONTENT_TYPES:
+        return create_error_response(400, f'content_type must be one of {ALLOWED_CONTENT_TYPES}')
+    try:
+        sizes = parse_sizes(params, count)
+    except ValueError as e:
+        return create_error_response(400, str(e))
+    receipt_id = uuid.uuid4().hex
+    uploads = []
+    try:
+        for page, size in enumerate(sizes):
+            key = page_key(receipt_id, page, count)
+            if size is not None and size > MAX_POST_BYTES:
+                uploads.append(multipart_upload(key, content_type, size))
+            else:
+                uploads.append(presigned_post(key, content_type))
+    except ClientError as e:
+        return create_error_response(500, str(e))
+    return create_response(200, {
+        'receipt_id': receipt_id,
+        'uploads': uploads,
+        'presigned_url': uploads[0].get('presigned_url'),
+        'file_url': uploads[0]['file_url'],
+        'max_bytes': MAX_POST_BYTES,
+        'max_multipart_bytes': MAX_MULTIPART_BYTES,
+        'ocr_max_bytes': OCR_MAX_BYTES,
+    })
+
+def parse_parts(parts):
+    if not isinstance(parts, list) or not parts:
+        raise ValueError('parts must be a non-empty list')
+    parsed = []
+    for part in parts:
+        if not isinstance(part, dict) or not isinstance(part.get('etag'), str):
+            raise ValueError('each part needs a part_number and an etag')
+        try:
+            parsed.append({'PartNumber': int(part.get('part_number')), 'ETag': part['etag']})
+        except (TypeError, ValueError):
+            raise ValueError('part_number must be an integer')
+    return sorted(parsed, key=lambda part: part['PartNumber'])
+
+def uploaded_bytes(key, upload_id):
+    total = 0
+    kwargs = {'Bucket': BUCKET_NAME, 'Key': key, 'UploadId': upload_id}
+    while True:
+        response = s3.list_parts(**kwargs)
+        total += sum(part['Size'] for part in response.get('Parts', []))
+        if not response.get('IsTruncated'):
+            return total
+        kwargs['PartNumberMarker'] = response['NextPartNumberMarker']
+
+@authenticate
+def complete_multipart_upload(event, context):
+    data = json.loads(event['body'])
+    key = data.get('key')
+    upload_id = data.get('upload_id')
+    if not isinstance(key, str) or not UPLOAD_KEY_PATTERN.match(key):
+        return create_error_response(400, 'Invalid key')
+    if not isinstance(upload_id, str) or not upload_id:
+        return create_error_response(400, 'upload_id is required')
+    try:
+        parts = parse_parts(data.get('parts'))
+    except ValueError as e:
+        return create_error_response(400, str(e))
+    try:
+        # Part uploads can't be size-limited when presigned, so check before completing
+        if uploaded_bytes(key, upload_id) > MAX_MULTIPART_BYTES:
+            s3.abort_multipart_upload(Bucket=BUCKET_NAME, Key=key, UploadId=upload_id)
+            return create_error_response(400, f'Upload exceeds {MAX_MULTIPART_BYTES} bytes')
+        s3.complete_multipart_upload(
+            Bucket=BUCKET_NAME,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={'Parts': parts}
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'NoSuchUpload':
+            return create_error_response(404, 'Upload not found')
+        return create_error_response(500, str(e))
+    return create_response(200, {'message': 'Upload completed', 'key': key, 'file_url': file_url(key)})
@@ -4,14 +4,24 @@ import boto3
 import datetime
 import random
 import re
+import base64
 from botocore.exceptions import ClientError
+from boto3.dynamodb.conditions import Key
 from http_utils import create_response, create_error_response
 from auth_utils import authenticate
 from sms_utils import send_sms, subscribe_phone_number
+from db_utils import role_repository, receipt_repository, user_repository
+from cache_utils import TTLCache
 
 table = boto3.resource('dynamodb').Table('users')
 otp_table = boto3.resource('dynamodb').Table('otp')
 
+# Short TTL since profile edits go through a different Lambda and can't invalidate this one
+user_cache = TTLCache('user', ttl=10)
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 50
+
 def get(event, context):
     user_ids = event['queryStringParameters'].get('id').split(',')
     keys = [{'id': user_id} for user_id in user_ids]
@@ -40,11 +50,12 @@ def post(event, context):
 def get_by_id(event, context):
     user = event['user']
     try:
-        response = table.get_item(Key={'id': user['id']})
+        item = user_cache.get_or_load(user['id'], lambda: user_repository.get({'id': user['id']}))
     except ClientError as e:
         return create_error_response(500, str(e))
-    if 'Item' in response:
-        return create_response(200, {'data': response['Item']})
+    user_cache.log_stats()
+    if item:
+        return create_response(200, {'data': item.to_item()})
     return create_error_response(404, "Item not found")
 
 @authenticate
@@ -99,4 +110,61 @@ def verify_otp(event, context):
         item = response['Item']
         if item['otp'] == otp:
             return create_response(200, {'message': 'OTP verified'})
-    return create_error_response(400, 'OTP not verified')
\ No newline at end of file
+    return create_error_response(400, 'OTP not verified')
+
+def encode_cursor(last_key):
+    return base64.urlsafe_b64encode(json.dumps(last_key).encode()).decode()
+
+def decode_cursor(cursor):
+    return json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+
+@authenticate
+def get_receipts(event, context):
+    user = event['user']
+    params = event.get('queryStringParameters') or {}
+    try:
+        limit = int(params.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return create_error_response(400, 'limit must be an integer')
+    if limit < 1:
+        return create_error_response(400, 'limit must be positive')
+    limit = min(limit, MAX_PAGE_SIZE)
+    try:
+        start_key = decode_cursor(params['cursor']) if params.get('cursor') else None
+    except ValueError:
+        return create_error_response(400, 'Invalid cursor')
+    # A cursor is a rolesByUser key for this user; anything else would fail the query
+    if start_key is not None and not (
+        isinstance(start_key, dict)
+        and all(isinstance(value, str) for value in start_key.values())
+        and start_key.get('user_id') == user['id']
+    ):
+        return create_error_response(400, 'Invalid cursor')
+    try:
+        roles, last_key = role_repository.query_page(
+            Key('user_id').eq(user['id']),
+            index='rolesByUser',
+            projection='history',
+            limit=limit,
+            start_key=start_key,
+            ascending=False
+        )
+        summaries = {
+            receipt.id: receipt
+            for receipt in receipt_repository.batch_get([{'id': role.receipt_id} for role in roles], projection='summary')
+        }
+    except ClientError as e:
+        return create_error_response(500, str(e))
+    receipts = []
+    for role in roles:
+        summary = summaries.get(role.receipt_id)
+        receipts.append({
+            'receipt_id': role.receipt_id,
+            'role': role.role,
+            'created_at': role.created_at,
+            'grand_total': summary.grand_total if summary else None,
+            'participant_count': (summary.participant_count or 0) if summary else 0,
+            'user_total': role.total,
+        })
+    cursor = encode_cursor(last_key) if last_key else None
+    return create_response(200, {'data': receipts, 'cursor': cursor})
@@ -33,6 +33,9 @@ export class FairshareBackendStack extends Stack {
       },
       removalPolicy: RemovalPolicy.DESTROY,
       autoDeleteObjects: true,
+      lifecycleRules: [
+        { abortIncompleteMultipartUploadAfter: Duration.days(1) },
+      ],
       cors: [
         {
           allowedMethods: [
@@ -47,6 +50,19 @@ export class FairshareBackendStack extends Stack {
       ],
     });
 
+    const exportBucket = new s3.Bucket(this, "ExportBucket", {
+      bucketName: "fairshare-export-bucket",
+      blockPublicAccess: s3.BlockPublicAccess.BLOCK_ALL,
+      removalPolicy: RemovalPolicy.DESTROY,
+      autoDeleteObjects: true,
+      lifecycleRules: [
+        {
+          expiration: Duration.days(7),
+          abortIncompleteMultipartUploadAfter: Duration.days(1),
+        },
+      ],
+    });
+
     const receiptTable = new dynamodb.Table(this, "ReceiptTable", {
       partitionKey: { name: "id", type: dynamodb.AttributeType.STRING },
       tableName: "receipts",
@@ -93,6 +109,15 @@ export class FairshareBackendStack extends Stack {
       removalPolicy: RemovalPolicy.DESTROY,
     });
 
+    const changesTable = new dynamodb.Table(this, "ChangesTable", {
+      partitionKey: { name: "receipt_id", type: dynamodb.AttributeType.STRING },
+      sortKey: { name: "seq", type: dynamodb.AttributeType.NUMBER },
+      timeToLiveAttribute: "ttl",
+      tableName: "changes",
+      billingMode: dynamodb.BillingMode.PAY_PER_REQUEST,
+      removalPolicy: RemovalPolicy.DESTROY,
+    });
+
     // Add phone number GSI to the users table
     usersTable.addGlobalSecondaryIndex({
       indexName: "usersByPhoneNumber",
@@ -106,6 +131,15 @@ export class FairshareBackendStack extends Stack {
       sortKey: { name: "user_id", type: dynamodb.AttributeType.STRING },
     });
 
+    // Add GSI to list a user's receipts, newest first
+    rolesTable.addGlobalSecondaryIndex({
+      indexName: "rolesByUser",
+      partitionKey: { name: "user_id", type: dynamodb.AttributeType.STRING },
+      sortKey: { name: "created_at", type: dynamodb.AttributeType.STRING },
+      projectionType: dynamodb.ProjectionType.INCLUDE,
+      nonKeyAttributes: ["role", "total"],
+    });
+
     const api = new aws_apigateway.RestApi(this, "FairshareBackendAPI", {
       restApiName: "Fairshare Backend API",
       description: "This service handles the backend for the Fairshare app",
@@ -247,15 +281,68 @@ export class FairshareBackendStack extends Stack {
       layers: [middlewareLayer],
     });
 
+    const completeMultipartUploadLambda = new lambda.Function(
+      this,
+      "CompleteMultipartUploadLambda",
+      {
+        runtime: lambda.Runtime.PYTHON_3_8,
+        handler: "upload.complete_multipart_upload",
+        code: lambda.Code.fromAsset(path.join(__dirname, "../backend/upload")),
+        environment: {
+          ...sharedEnvironment,
+          BUCKET_NAME: receiptImageBucket,
+        },
+        timeout: Duration.seconds(30),
+        role: sharedRole,
+        layers: [middlewareLayer],
+      }
+    );
+
     const ocrLambda = new lambda.Function(this, "OcrLambda", {
       runtime: lambda.Runtime.PYTHON_3_8,
       handler: "ocr.receipt_ocr",
-      code: lambda.Code.fromAsset(path.join(__dirname, "../backend/ocr")),
+      code: lambda.Code.fromAsset(path.join(__dirname, "../backend/ocr"), {
+        bundling: {
+          image: lambda.Runtime.PYTHON_3_8.bundlingImage,
+          command: [
+            "bash",
+            "-c",
+            "pip install -r requirements.txt -t /asset-output && cp -au . /asset-output",
+          ],
+        },
+      }),
       environment: {
         ...sharedEnvironment,
         BUCKET_NAME: receiptImageBucket,
+        OCR_PREPROCESS: process.env.OCR_PREPROCESS || "false",
       },
       timeout: Duration.seconds(30),
+      memorySize: 1024,
+      role: ocrRole,
+      layers: [middlewareLayer],
+    });
+
+    const batchOcrLambda = new lambda.Function(this, "BatchOcrLambda", {
+      runtime: lambda.Runtime.PYTHON_3_8,
+      handler: "ocr.batch_receipt_ocr",
+      code: lambda.Code.fromAsset(path.join(__dirname, "../backend/ocr"), {
+        bundling: {
+          image: lambda.Runtime.PYTHON_3_8.bundlingImage,
+          command: [
+            "bash",
+            "-c",
+            "pip install -r requirements.txt -t /asset-output && cp -au . /asset-output",
+          ],
+        },
+      }),
+      environment: {
+        ...sharedEnvironment,
+        BUCKET_NAME: receiptImageBucket,
+        OCR_PREPROCESS: process.env.OCR_PREPROCESS || "false",
+        OCR_MAX_WORKERS: process.env.OCR_MAX_WORKERS || "4",
+      },
+      timeout: Duration.seconds(30),
+      memorySize: 1024,
       role: ocrRole,
       layers: [middlewareLayer],
     });
@@ -458,6 +545,67 @@ export class FairshareBackendStack extends Stack {
       layers: [middlewareLayer],
     });
 
+    const getUserReceiptsLambda = new lambda.Function(
+      this,
+      "GetUserReceipts",
+      {
+        runtime: lambda.Runtime.PYTHON_3_8,
+        handler: "user.get_receipts",
+        code: lambda.Code.fromAsset(path.join(__dirname, "../backend/user")),
+        environment: sharedEnvironment,
+        timeout: Duration.seconds(30),
+        role: sharedRole,
+        layers: [middlewareLayer],
+      }
+    );
+
+    const exportWorkerLambda = new lambda.Function(this, "ExportWorker", {
+      runtime: lambda.Runtime.PYTHON_3_8,
+      handler: "export.run",
+      code: lambda.Code.fromAsset(path.join(__dirname, "../backend/export")),
+      environment: {
+        ...sharedEnvironment,
+        EXPORT_BUCKET_NAME: exportBucket.bucketName,
+      },
+      timeout: Duration.minutes(15),
+      memorySize: 512,
+      // A retried export would redo the whole scan; failures are reported via S3
+      retryAttempts: 0,
+      role: sharedRole,
+      layers: [middlewareLayer],
+    });
+
+    const startExportLambda = new lambda.Function(this, "StartExport", {
+      runtime: lambda.Runtime.PYTHON_3_8,
+      handler: "export.start",
+      code: lambda.Code.fromAsset(path.join(__dirname, "../backend/export")),
+      environment: {
+        ...sharedEnvironment,
+        EXPORT_BUCKET_NAME: exportBucket.bucketName,
+        EXPORT_FUNCTION_NAME: exportWorkerLambda.functionName,
+      },
+      timeout: Duration.seconds(30),
+      role: sharedRole,
+      layers: [middlewareLayer],
+    });
+
+    const getExportStatusLambda = new lambda.Function(
+      this,
+      "GetExportStatus",
+      {
+        runtime: lambda.Runtime.PYTHON_3_8,
+        handler: "export.status",
+        code: lambda.Code.fromAsset(path.join(__dirname, "../backend/export")),
+        environment: {
+          ...sharedEnvironment,
+          EXPORT_BUCKET_NAME: exportBucket.bucketName,
+        },
+        timeout: Duration.seconds(30),
+        role: sharedRole,
+        layers: [middlewareLayer],
+      }
+    );
+
     const createPermissionLambda = new lambda.Function(
       this,
       "CreatePermission",
@@ -482,6 +630,34 @@ export class FairshareBackendStack extends Stack {
       layers: [middlewareLayer],
     });
 
+    const updatePermissionLambda = new lambda.Function(
+      this,
+      "UpdatePermission",
+      {
+        runtime: lambda.Runtime.PYTHON_3_8,
+        handler: "role.update",
+        code: lambda.Code.fromAsset(path.join(__dirname, "../backend/role")),
+        environment: sharedEnvironment,
+        timeout: Duration.seconds(30),
+        role: sharedRole,
+        layers: [middlewareLayer],
+      }
+    );
+
+    const deletePermissionLambda = new lambda.Function(
+      this,
+      "DeletePermission",
+      {
+        runtime: lambda.Runtime.PYTHON_3_8,
+        handler: "role.delete_by_id",
+        code: lambda.Code.fromAsset(path.join(__dirname, "../backend/role")),
+        environment: sharedEnvironment,
+        timeout: Duration.seconds(30),
+        role: sharedRole,
+        layers: [middlewareLayer],
+      }
+    );
+
     const getReceiptParticipantsLambda = new lambda.Function(
       this,
       "GetReceiptParticipants",
@@ -496,6 +672,16 @@ export class FairshareBackendStack extends Stack {
       }
     );
 
+    const getChangesLambda = new lambda.Function(this, "GetChanges", {
+      runtime: lambda.Runtime.PYTHON_3_8,
+      handler: "change.get",
+      code: lambda.Code.fromAsset(path.join(__dirname, "../backend/change")),
+      environment: sharedEnvironment,
+      timeout: Duration.seconds(30),
+      role: sharedRole,
+      layers: [middlewareLayer],
+    });
+
     receiptTable.grantReadWriteData(createReceiptLambda);
     receiptTable.grantReadWriteData(getReceiptByIdLambda);
     receiptTable.grantReadWriteData(updateReceiptByIdLambda);
@@ -507,6 +693,14 @@ export class FairshareBackendStack extends Stack {
     usersTable.grantReadWriteData(updateUserByIdLambda);
     rolesTable.grantReadWriteData(createPermissionLambda);
     rolesTable.grantReadWriteData(getPermissionLambda);
+    receiptTable.grantReadWriteData(createPermissionLambda);
+    rolesTable.grantReadWriteData(updatePermissionLambda);
+    rolesTable.grantReadWriteData(deletePermissionLambda);
+    receiptTable.grantReadWriteData(deletePermissionLambda);
+    rolesTable.grantReadData(getReceiptParticipantsLambda);
+    usersTable.grantReadData(getReceiptParticipantsLambda);
+    rolesTable.grantReadData(getUserReceiptsLambda);
+    receiptTable.grantReadData(getUserReceiptsLambda);
     usersTable.grantReadWriteData(deleteUserByIdLambda);
     itemsTable.grantReadWriteData(createItemLambda);
     itemsTable.grantReadWriteData(getItemsLambda);
@@ -514,6 +708,8 @@ export class FairshareBackendStack extends Stack {
     itemsTable.grantReadWriteData(updateItemByIdLambda);
     itemsTable.grantReadWriteData(deleteItemByIdLambda);
     itemsTable.grantReadWriteData(ocrLambda);
+    receiptTable.grantReadWriteData(batchOcrLambda);
+    itemsTable.grantReadWriteData(batchOcrLambda);
     splitsTable.grantReadWriteData(createSplitLambda);
     splitsTable.grantReadWriteData(getSplitsLambda);
     splitsTable.grantReadWriteData(getSplitByIdLambda);
@@ -521,18 +717,54 @@ export class FairshareBackendStack extends Stack {
     splitsTable.grantReadWriteData(deleteSplitByIdLambda);
     otpTable.grantReadWriteData(createOTPLambda);
     otpTable.grantReadWriteData(verifyOTPLambda);
+    [
+      createReceiptLambda,
+      updateReceiptByIdLambda,
+      deleteReceiptByIdLambda,
+      createItemLambda,
+      updateItemByIdLambda,
+      deleteItemByIdLambda,
+      createSplitLambda,
+      updateSplitByIdLambda,
+      deleteSplitByIdLambda,
+      createPermissionLambda,
+      updatePermissionLambda,
+      deletePermissionLambda,
+    ].forEach((fn) => changesTable.grantReadWriteData(fn));
+    changesTable.grantReadData(getChangesLambda);
+    rolesTable.grantReadData(exportWorkerLambda);
+    receiptTable.grantReadData(exportWorkerLambda);
+    itemsTable.grantReadData(exportWorkerLambda);
+    splitsTable.grantReadData(exportWorkerLambda);
+    exportBucket.grantReadWrite(exportWorkerLambda);
+    exportBucket.grantRead(getExportStatusLambda);
+    exportWorkerLambda.grantInvoke(startExportLambda);
+    changesTable.grantReadData(getItemsLambda);
+    changesTable.grantReadWriteData(ocrLambda);
+    changesTable.grantReadWriteData(batchOcrLambda);
+    receiptTable.grantReadData(getChangesLambda);
+    itemsTable.grantReadData(getChangesLambda);
+    splitsTable.grantReadData(getChangesLambda);
+    rolesTable.grantReadData(getChangesLambda);
 
     api.root.addMethod(
       "GET",
       new aws_apigateway.LambdaIntegration(rootHandlerLambda)
     );
     const uploadResource = api.root.addResource("upload");
+    const multipartUploadResource = uploadResource.addResource("multipart");
+    const completeMultipartUploadResource =
+      multipartUploadResource.addResource("complete");
     const ocrResource = api.root.addResource("ocr");
+    const batchOcrResource = ocrResource.addResource("batch");
     const tokenResource = api.root.addResource("token");
     const generateOTPResource = api.root.addResource("otp_generate");
     const verifyOTPResource = api.root.addResource("otp_verify");
     const userResource = api.root.addResource("user");
     const userByIDResource = userResource.addResource("{user_id}");
+    const userReceiptsResource = userResource.addResource("receipts");
+    const userExportResource = userResource.addResource("export");
+    const userExportByIDResource = userExportResource.addResource("{job_id}");
     const receiptResource = api.root.addResource("receipt");
     const receiptByIDResource = receiptResource.addResource("{receipt_id}");
     const itemResource = receiptByIDResource.addResource("item");
@@ -542,15 +774,24 @@ export class FairshareBackendStack extends Stack {
     const roleResource = receiptByIDResource.addResource("role");
     const receiptRolesResource =
       receiptByIDResource.addResource("participants");
+    const changesResource = receiptByIDResource.addResource("changes");
 
     uploadResource.addMethod(
       "GET",
       new aws_apigateway.LambdaIntegration(presignedUrlLambda)
     );
+    completeMultipartUploadResource.addMethod(
+      "POST",
+      new aws_apigateway.LambdaIntegration(completeMultipartUploadLambda)
+    );
     ocrResource.addMethod(
       "POST",
       new aws_apigateway.LambdaIntegration(ocrLambda)
     );
+    batchOcrResource.addMethod(
+      "POST",
+      new aws_apigateway.LambdaIntegration(batchOcrLambda)
+    );
     tokenResource.addMethod(
       "POST",
       new aws_apigateway.LambdaIntegration(createJWTLambda)
@@ -575,6 +816,18 @@ export class FairshareBackendStack extends Stack {
       "GET",
       new aws_apigateway.LambdaIntegration(getUsersLambda)
     );
+    userReceiptsResource.addMethod(
+      "GET",
+      new aws_apigateway.LambdaIntegration(getUserReceiptsLambda)
+    );
+    userExportResource.addMethod(
+      "POST",
+      new aws_apigateway.LambdaIntegration(startExportLambda)
+    );
+    userExportByIDResource.addMethod(
+      "GET",
+      new aws_apigateway.LambdaIntegration(getExportStatusLambda)
+    );
     userByIDResource.addMethod(
       "GET",
       new aws_apigateway.LambdaIntegration(getUserByIdLambda)
@@ -651,10 +904,22 @@ export class FairshareBackendStack extends Stack {
       "GET",
       new aws_apigateway.LambdaIntegration(getPermissionLambda)
     );
+    roleResource.addMethod(
+      "PUT",
+      new aws_apigateway.LambdaIntegration(updatePermissionLambda)
+    );
+    roleResource.addMethod(
+      "DELETE",
+      new aws_apigateway.LambdaIntegration(deletePermissionLambda)
+    );
     receiptRolesResource.addMethod(
       "GET",
       new aws_apigateway.LambdaIntegration(getReceiptParticipantsLambda)
     );
+    changesResource.addMethod(
+      "GET",
+      new aws_apigateway.LambdaIntegration(getChangesLambda)
+    );
 
     new CfnOutput(this, "ApiUrl", {
       value: api.url,